@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import numpy as np
 
 def trim_to_max_freq(report_df, max_freq) :
     """trims a report dataframe to a maximum frequency by aggregating larger frequencies.
@@ -33,8 +34,38 @@ def trim_to_max_freq(report_df, max_freq) :
 
     pass
 
+def _max_freqs(max_freq, n_dims) :
+    """The maximum frequency of each dimension as an integer vector, from a single max_freq shared by all the dimensions or a per dimension list."""
+    max_freqs = np.asarray(max_freq)
+    if max_freqs.ndim > 1 or (max_freqs.ndim == 1 and len(max_freqs) != n_dims) :
+        raise Exception(f"max_freq {max_freq} should be an integer or a list of {n_dims} integers.")
+    return np.broadcast_to(max_freqs.astype(int), [n_dims])
+
 def reverse_cumsum(x, axis) :
     """Calculate the cumsum along axis from the last element to the first.
 
     """
     return np.flip(np.cumsum(np.flip(x, axis=axis), axis=axis), axis=axis)
+
+def truncate_box(box, n_dims, max_freq, new_max_freq) :
+    """Aggregates a truncated reach box to a smaller max_freq by summing the reach of the frequencies from `new_max_freq` up along each dimension.
+
+    Args:
+        box (numpy ndarray): The reach box of shape (n_grs, prod(max_freq_d+1)) in the `itertools.product` order of the frequencies, e.g. the output of `ftrunc_reach`.
+        n_dims (int): The number of dimensions of the box.
+        max_freq (int or list of ints): The maximum frequency of the box, or of each of its dimensions.
+        new_max_freq (int or list of ints): The maximum frequency to truncate to, less than or equal to `max_freq`.
+
+    Returns:
+        The reach box of shape (n_grs, prod(new_max_freq_d+1)).
+    """
+    max_freqs, new_max_freqs = _max_freqs(max_freq, n_dims), _max_freqs(new_max_freq, n_dims)
+    if np.any(new_max_freqs > max_freqs) :
+        raise Exception(f"new_max_freq should be less than or equal to {max_freq}")
+
+    box = np.reshape(box, [-1, *(max_freqs+1)])
+    for d in range(n_dims) :
+        tail = np.take(reverse_cumsum(box, axis=d+1), [new_max_freqs[d]], axis=d+1)
+        box  = np.concatenate([np.take(box, range(new_max_freqs[d]), axis=d+1), tail], axis=d+1)
+
+    return box.reshape([box.shape[0], -1])
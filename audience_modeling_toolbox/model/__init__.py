@@ -3,3 +3,8 @@ from audience_modeling_toolbox.model.models import NormalDeltaADF
 from audience_modeling_toolbox.model.nonsimple import MixtureADF
 from audience_modeling_toolbox.model.nonsimple import MixtureOfExponentials
 from audience_modeling_toolbox.model.nonsimple import MixtureOfDeltas
+from audience_modeling_toolbox.model.optimizer import MediaMixOptimizer
+from audience_modeling_toolbox.model.surface import ReachSurfaceIndex
+from audience_modeling_toolbox.model.training import TrainingProblem
+from audience_modeling_toolbox.model.config import set_default_dtype, get_default_dtype, set_num_threads, get_num_threads
+from audience_modeling_toolbox.model.batch import BatchTrainer
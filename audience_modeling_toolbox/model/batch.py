@@ -0,0 +1,298 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+import time
+import multiprocessing
+
+from audience_modeling_toolbox.model.models import _outer_box
+from audience_modeling_toolbox.model.nonsimple import MixtureADF
+from audience_modeling_toolbox.model.training import TrainingProblem
+
+# the termination messages of the batched fits by status, as in `scipy.optimize.least_squares`
+_MESSAGES = {
+    0 : "The maximum number of function evaluations is exceeded.",
+    2 : "`ftol` termination condition is satisfied.",
+    3 : "`xtol` termination condition is satisfied.",
+}
+
+def _train_task(task) :
+    """Trains the ADF of the `(index, adf, problem, options)` task on the compiled `problem`, the task of the problems of `BatchTrainer` that aren't batched.
+
+    Returns:
+        The tuple of `(index, amplitudes, parameters, result)` of the fit, the result is None if the fit failed.
+    """
+    i, adf, problem, options = task
+    try :
+        result = adf.train(problem, **options)
+    except Exception :
+        result = None
+
+    return i, adf.amplitudes, adf.parameters, result
+
+class BatchTrainer :
+    """Trains many mixture ADFs, e.g. one per segment and campaign, each on its own reports.
+
+    The problems with the same shape, i.e. mixtures of the same simple ADF types fitted to targets of the same boxes and number of gross ratings, are stacked along a leading problem axis and advanced together by a bounded Levenberg-Marquardt iteration: the reach boxes and the jacobians of all of them are evaluated by one set of array operations and their normal equations are solved as one batch, so the Python overhead of an iteration is paid once per batch rather than once per problem. The remaining problems (and the objectives without a batched evaluation, i.e. "kplus") are trained by `MixtureADF.train` on a process pool.
+
+    The ADFs are trained in place and the results are delivered as the problems converge, see `run`.
+    """
+
+    def __init__(self, problems, what="reach_truncate", min_batch=2, batch_size=2**10) :
+        """
+        Args:
+            problems (list of tuples) : The `(adf, reports)` of each problem, where the reports are a list of `RFReport` or a compiled `TrainingProblem`.
+            what (str or list of str) : The targets of the reports that aren't compiled yet, see `TrainingProblem`.
+            min_batch (int) : The smallest number of problems of the same shape that are batched, the others go to the process pool.
+            batch_size (int) : The largest number of problems advanced together, bounding the memory of the jacobians of a batch.
+        """
+        self.adfs     = []
+        self.problems = []
+        for adf, reports in problems :
+            if not isinstance(adf, MixtureADF) :
+                raise Exception(f"Only mixture ADFs can be batch trained, not {type(adf).__name__}.")
+            if not isinstance(reports, TrainingProblem) :
+                reports = TrainingProblem(list(reports), what=what)
+            self.adfs.append(adf)
+            self.problems.append(reports)
+
+        shapes = {}
+        for i, (adf, problem) in enumerate(zip(self.adfs, self.problems)) :
+            shapes.setdefault(self._shape(adf, problem), []).append(i)
+
+        self.batches = []
+        self.pooled  = []
+        for shape, indices in shapes.items() :
+            if shape is None or len(indices) < min_batch :
+                self.pooled.extend(indices)
+            else :
+                self.batches.extend(indices[start:start+batch_size] for start in range(0, len(indices), batch_size))
+
+    @staticmethod
+    def _shape(adf, problem) :
+        """The key of the problems that can be batched together, None if the problem has no batched evaluation."""
+        if any(kind != "box" for kind, max_freq, grs, start, stop in problem.blocks) :
+            return None
+        return (
+            type(adf), tuple(adf._simple_types), adf.n_dims,
+            tuple((tuple(max_freq), len(grs), stop - start) for kind, max_freq, grs, start, stop in problem.blocks)
+        )
+
+    @staticmethod
+    def _tables(adf, parameters, grs, max_freq, gradient=False) :
+        """The tables of `MixtureADF._component_tables` of the stacked `parameters` of a batch, with the simple ADFs of all the mixtures in a row along the first axis (see `_outer_box`)."""
+        tables = adf._component_tables(grs, max_freq, gradient=gradient, parameters=parameters)
+        return [table.reshape([-1, *table.shape[-2:]]) for table in tables]
+
+    @staticmethod
+    def _residuals(adf, problem, grs, targets, scales, xs) :
+        """The residuals of a batch of problems of the same shape as `problem`, of shape (n_problems, size).
+
+        Args:
+            adf (MixtureADF) : An ADF of the batch, for its simple ADF types.
+            problem (TrainingProblem) : A problem of the batch, for its blocks.
+            grs (list of numpy ndarrays) : The stacked gross ratings of each block of shape (n_problems, n_grs, n_dims).
+            targets, scales (numpy ndarray) : The stacked targets and weights of the residuals of shape (n_problems, size).
+            xs (numpy ndarray) : The stacked `[*amplitudes, *parameters]` of shape (n_problems, n_simples + n_parameters).
+        """
+        n = adf.n_simples
+        amplitudes = xs[:, :n]
+        parameters = xs[:, n:].reshape([len(xs), n, adf.n_dims])
+
+        residuals = np.empty([len(xs), problem.size])
+        residuals[:, 0] = 1 - np.sum(amplitudes, axis=1)
+        residuals[:, 1:problem.n_constraints] = 1 - np.einsum('pi,pid->pd', amplitudes, parameters)
+        for b, (kind, max_freq, block_grs, start, stop) in enumerate(problem.blocks) :
+            boxes = _outer_box(BatchTrainer._tables(adf, parameters, grs[b], max_freq)).reshape([len(xs), n, -1])
+            residuals[:, start:stop] = targets[:, start:stop] - np.einsum('pi,pic->pc', amplitudes, boxes)
+
+        return residuals * scales
+
+    @staticmethod
+    def _jacobians(adf, problem, grs, scales, xs) :
+        """The jacobians of `_residuals` of shape (n_problems, size, n_simples + n_parameters)."""
+        n, n_dims = adf.n_simples, adf.n_dims
+        amplitudes = xs[:, :n]
+        parameters = xs[:, n:].reshape([len(xs), n, n_dims])
+
+        jacobians = np.zeros([len(xs), problem.size, xs.shape[1]])
+        jacobians[:, 0, :n] = -1.0
+        jacobians[:, 1:problem.n_constraints, :n] = -np.swapaxes(parameters, 1, 2)
+        for d in range(n_dims) :
+            jacobians[:, 1 + d, n + d::n_dims] = -amplitudes
+
+        for b, (kind, max_freq, block_grs, start, stop) in enumerate(problem.blocks) :
+            tables    = BatchTrainer._tables(adf, parameters, grs[b], max_freq)
+            gradients = BatchTrainer._tables(adf, parameters, grs[b], max_freq, gradient=True)
+
+            # (n_problems, n_simples, n_grs * n_cells [, n_dims]) -> (n_problems, n_grs * n_cells, n_simples [* n_dims])
+            amplitudes_jacobian = _outer_box(tables).reshape([len(xs), n, -1])
+            parameters_jacobian = np.stack([
+                _outer_box(tables[:d] + [gradients[d]] + tables[d+1:]).reshape([len(xs), n, -1])
+                for d in range(n_dims)
+            ], axis=-1) * amplitudes[:, :, np.newaxis, np.newaxis]
+
+            jacobians[:, start:stop, :n] = -np.swapaxes(amplitudes_jacobian, 1, 2)
+            jacobians[:, start:stop, n:] = -np.moveaxis(parameters_jacobian, 1, 2).reshape([len(xs), stop - start, -1])
+
+        return jacobians * scales[:, :, np.newaxis]
+
+    def _fit_batch(self, indices, max_nfev, ftol, xtol) :
+        """Fits the problems `indices` of the same shape together, yielding the `(index, result)` of the problems that converged at every iteration."""
+        adfs     = [self.adfs[i] for i in indices]
+        problems = [self.problems[i] for i in indices]
+        adf, problem = adfs[0], problems[0]
+        n = adf.n_simples
+
+        grs     = [np.stack([p.blocks[b][2] for p in problems]) for b in range(len(problem.blocks))]
+        targets = np.stack([p.targets for p in problems])
+        scales  = np.stack([np.ones(p.size) if p.scales is None else p.scales for p in problems])
+        lower   = np.array([[1.0e-5] * n + a._parameters_bounds(which="lower") for a in adfs])
+        upper   = np.array([[1.0]    * n + a._parameters_bounds(which="upper") for a in adfs])
+        xs      = np.clip(np.array([[*a.amplitudes, *a.parameters] for a in adfs]), lower, upper)
+
+        start      = time.perf_counter()
+        active     = np.arange(len(indices))
+        residuals  = self._residuals(adf, problem, grs, targets, scales, xs)
+        costs      = np.sum(residuals**2, axis=1) / 2
+        jacobians  = self._jacobians(adf, problem, grs, scales, xs)
+        dampings   = np.full(len(indices), 1.0e-3)
+        growths    = np.full(len(indices), 2.0)
+        diagonals  = np.zeros(xs.shape)
+        nfev, njev = np.ones(len(indices), dtype=int), np.ones(len(indices), dtype=int)
+        status     = np.full(len(indices), -1)
+
+        while len(active) > 0 :
+            # the Levenberg-Marquardt steps of all the problems projected on the bounds, scaled by the largest diagonal of the normal
+            # equations so far (as in MINPACK), which keeps damping the parameters of the simple ADFs whose amplitude vanishes
+            gradients = (residuals[:, np.newaxis, :] @ jacobians)[:, 0]
+            normals   = np.swapaxes(jacobians, 1, 2) @ jacobians
+            diagonals[active] = np.maximum(diagonals[active], np.diagonal(normals, axis1=1, axis2=2))
+            damped = normals + (dampings[active, np.newaxis] * np.maximum(diagonals[active], 1.0e-12))[:, :, np.newaxis] * np.eye(xs.shape[1])
+            try :
+                steps = -np.linalg.solve(damped, gradients[:, :, np.newaxis])[:, :, 0]
+            except np.linalg.LinAlgError :
+                # the normal equations of identical simple ADFs can be singular within the rounding
+                steps = -(np.linalg.pinv(damped) @ gradients[:, :, np.newaxis])[:, :, 0]
+            candidates = np.clip(xs[active] + steps, lower[active], upper[active])
+
+            candidate_residuals = self._residuals(adf, problem, [g[active] for g in grs], targets[active], scales[active], candidates)
+            candidate_costs     = np.sum(candidate_residuals**2, axis=1) / 2
+            nfev[active] += 1
+
+            # the ratio of the actual and the predicted decrease of the cost along the (projected) step
+            moves     = candidates - xs[active]
+            predicted = -np.sum(moves * (gradients + (normals @ moves[:, :, np.newaxis])[:, :, 0] / 2), axis=1)
+            gains     = (costs[active] - candidate_costs) / np.maximum(predicted, 1.0e-300)
+            accepted  = candidate_costs < costs[active]
+            changes  = np.linalg.norm(moves, axis=1)
+            status[active] = np.select(
+                [accepted & (costs[active] - candidate_costs <= ftol * costs[active]),
+                 changes <= xtol * (xtol + np.linalg.norm(xs[active], axis=1)),
+                 nfev[active] >= max_nfev],
+                [2, 3, 0], default=-1
+            )
+
+            # the damping follows the gain ratio (the update of Nielsen), the rejected steps are retried with a growing damping
+            dampings[active] = np.where(accepted, np.maximum(dampings[active] * np.maximum(1 / 3, 1 - (2 * gains - 1)**3), 1.0e-10), dampings[active] * growths[active])
+            growths[active]  = np.where(accepted, 2.0, growths[active] * 2)
+            xs[active[accepted]]    = candidates[accepted]
+            costs[active[accepted]] = candidate_costs[accepted]
+
+            done = status[active] >= 0
+            for j in active[done] :
+                adfs[j].amplitudes = xs[j, :n].copy()
+                adfs[j].parameters = xs[j, n:].copy()
+                yield indices[j], OptimizeResult(
+                    x=xs[j].copy(), cost=costs[j], nfev=nfev[j], njev=njev[j], status=status[j], success=status[j] > 0,
+                    message=_MESSAGES[status[j]], time=time.perf_counter() - start
+                )
+
+            # the residuals of the accepted steps are kept and the jacobians are only evaluated there
+            residuals = np.where(accepted[:, np.newaxis], candidate_residuals, residuals)[~done]
+            jacobians = jacobians[~done]
+            renew     = accepted[~done]
+            active    = active[~done]
+            if renew.any() :
+                jacobians[renew] = self._jacobians(adf, problem, [g[active[renew]] for g in grs], scales[active[renew]], xs[active[renew]])
+                njev[active[renew]] += 1
+
+    def _collect(self, results, wait=False) :
+        """Yields the `(index, result)` of the pooled problems that are done (of all of them if `wait`), setting the fitted ADFs.
+
+        Args:
+            results (iterator) : The `imap_unordered` iterator of the `_train_task` of the pooled problems.
+            wait (bool) : If True waits for all the remaining problems, otherwise only takes the ones that are already done.
+        """
+        while True :
+            try :
+                i, amplitudes, parameters, result = results.next(timeout=None if wait else 0)
+            except (StopIteration, multiprocessing.TimeoutError) :
+                return
+
+            if result is not None :
+                self.adfs[i].amplitudes = amplitudes
+                self.adfs[i].parameters = parameters
+            yield i, result
+
+    def run(self, max_nfev=1000, ftol=1.0e-8, xtol=1.0e-8, n_workers=None, **options) :
+        """Trains all the ADFs, yielding the results as the problems converge.
+
+        The pooled problems are submitted first and collected between the iterations of the batches, so the pool works while the batches are advanced. When the generator is closed early the worker processes are terminated, including the fits that are still running.
+
+        Args:
+            max_nfev (int) : The maximum number of residual evaluations of each batched problem.
+            ftol (float) : A batched problem converges when a step reduces its cost by less than this fraction.
+            xtol (float) : A batched problem converges when a step changes its amplitudes and parameters by less than this fraction.
+            n_workers (int) : The number of processes of the pool (default None, the number of CPUs), 1 trains the pooled problems one by one in this process after the batches.
+            options : The options of `MixtureADF.train` for the pooled problems, e.g. `solver` or `method` (the batches always evaluate by recurrence).
+
+        Yields:
+            The tuple of `(index, result)` of each problem, in the order they are done, where `index` is the position of the problem in `problems` and `result` is a `scipy.optimize.OptimizeResult` (with the `cost`, `nfev`, `status` and `success` of the fit), or None if a pooled fit failed. The ADF of the problem is trained when its result is yielded.
+        """
+        tasks   = [(i, self.adfs[i], self.problems[i], options) for i in self.pooled]
+        pool = None
+        if len(tasks) > 0 and n_workers != 1 :
+            pool    = multiprocessing.Pool(n_workers)
+            results = pool.imap_unordered(_train_task, tasks)
+
+        try :
+            for indices in self.batches :
+                for result in self._fit_batch(indices, max_nfev, ftol, xtol) :
+                    yield result
+                    if pool is not None :
+                        yield from self._collect(results)
+
+            if pool is None :
+                for task in tasks :
+                    i, amplitudes, parameters, result = _train_task(task)
+                    yield i, result
+            else :
+                yield from self._collect(results, wait=True)
+        finally :
+            # the pool is terminated rather than closed, so the pooled fits that are still running are stopped as well
+            if pool is not None :
+                pool.terminate()
+                pool.join()
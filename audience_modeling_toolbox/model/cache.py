@@ -0,0 +1,125 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+
+import functools
+import hashlib
+import inspect
+from collections import OrderedDict
+
+class ReachCache :
+    """A least recently used cache of reach evaluations with a memory budget.
+
+    The entries are keyed by a hash of the name of the evaluation, the parameters of the ADF and the query arrays, so a cached value is never returned for a different model state.
+    """
+
+    def __init__(self, max_bytes=2**27) :
+        """
+        Args:
+            max_bytes (int) : The memory budget of the cached arrays in bytes (default 128MB).
+        """
+        self.max_bytes = max_bytes
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+        self.clear()
+
+    def clear(self) :
+        """Removes all the entries, the statistics are kept."""
+        self._entries = OrderedDict()
+        self.n_bytes  = 0
+
+    @staticmethod
+    def key(*items) :
+        """The hash of a sequence of arrays and (hashable) scalars."""
+        digest = hashlib.blake2b(digest_size=16)
+        for item in items :
+            if isinstance(item, (np.ndarray, list, tuple)) :
+                item = np.ascontiguousarray(item)
+                digest.update(f"{item.dtype}{item.shape}".encode())
+                digest.update(item.tobytes())
+            else :
+                digest.update(repr(item).encode())
+            digest.update(b"|")
+        return digest.digest()
+
+    def get(self, key) :
+        """The cached array of `key` or None, counting the hits and misses."""
+        value = self._entries.get(key)
+        if value is None :
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value) :
+        """Caches the array `value`, evicting the least recently used entries beyond the memory budget."""
+        if value.nbytes > self.max_bytes or key in self._entries :
+            return
+
+        self._entries[key] = value
+        self.n_bytes += value.nbytes
+        while self.n_bytes > self.max_bytes :
+            key, evicted = self._entries.popitem(last=False)
+            self.n_bytes   -= evicted.nbytes
+            self.evictions += 1
+
+    def info(self) :
+        """The statistics of the cache as a dictionary."""
+        return {
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "evictions" : self.evictions,
+            "entries"   : len(self._entries),
+            "bytes"     : self.n_bytes,
+            "max_bytes" : self.max_bytes,
+        }
+
+def _memoized(method) :
+    """Caches the results of a reach evaluation method of an ADF when its cache is enabled (see `AbstractADF.enable_cache`)."""
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs) :
+        if self._cache is None :
+            return method(self, *args, **kwargs)
+
+        # the arguments are bound to their names so that positional and keyword calls share the entries
+        arguments = signature.bind(self, *args, **kwargs)
+        arguments.apply_defaults()
+        # the dtype is part of the key, it can change with the global default without touching the ADF (see `set_default_dtype`)
+        key = ReachCache.key(
+            method.__name__, self.dtype, self.parameters, getattr(self, "amplitudes", None),
+            *list(arguments.arguments.values())[1:]
+        )
+        value = self._cache.get(key)
+        if value is None :
+            value = method(self, *args, **kwargs)
+            self._cache.put(key, value)
+
+        # the callers get their own copy so that the cached array can't be modified
+        return value.copy()
+
+    return wrapper
@@ -0,0 +1,110 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+_FLOAT_DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
+
+_default_dtype = np.dtype(np.float64)
+
+_num_threads = 1
+_block_size  = 2**10
+_thread_pool = None
+
+def _check_dtype(dtype) :
+    """The numpy dtype of `dtype`, which has to be float32 or float64."""
+    dtype = np.dtype(dtype)
+    if dtype not in _FLOAT_DTYPES :
+        raise Exception(f"The dtype of the reach evaluation has to be float32 or float64, not {dtype}.")
+    return dtype
+
+def set_default_dtype(dtype) :
+    """Sets the floating point type of the reach evaluations of all the ADFs without a dtype of their own.
+
+    Single precision halves the memory of the reach boxes and speeds up the broadcasted kernels, its relative error is about 1e-7. The precision-sensitive parts (the incomplete gamma tails, the reach_plus from a sum of the pmfs, the log method and the residuals of the training) are always evaluated in double precision.
+
+    Args:
+        dtype (numpy dtype) : `np.float32` or `np.float64` (the default).
+    """
+    global _default_dtype
+    _default_dtype = _check_dtype(dtype)
+
+def get_default_dtype() :
+    """The floating point type of the reach evaluations of the ADFs without a dtype of their own."""
+    return _default_dtype
+
+def set_num_threads(n_threads, block_size=2**10) :
+    """Sets the number of threads of the reach evaluations of the ADFs.
+
+    With more than one thread `f_reach`, `fplus_reach`, `cell_reach` and `ftrunc_reach` split the gross ratings into blocks that are evaluated on a thread pool (numpy and scipy release the GIL in the kernels). Every block is written into its rows of a preallocated result, so the results are identical to the single threaded evaluation.
+
+    Args:
+        n_threads (int) : The number of threads, 1 (the default) evaluates everything in the calling thread.
+        block_size (int) : The number of gross ratings evaluated together by a thread.
+    """
+    global _num_threads, _block_size, _thread_pool
+    if int(n_threads) < 1 or int(block_size) < 1 :
+        raise Exception(f"The number of threads {n_threads} and the block size {block_size} have to be positive.")
+
+    if _thread_pool is not None and int(n_threads) != _num_threads :
+        _thread_pool.shutdown()
+        _thread_pool = None
+    _num_threads, _block_size = int(n_threads), int(block_size)
+
+def get_num_threads() :
+    """The number of threads of the reach evaluations of the ADFs."""
+    return _num_threads
+
+def _get_thread_pool() :
+    """The shared thread pool of the reach evaluations, created on first use."""
+    global _thread_pool
+    if _thread_pool is None :
+        _thread_pool = ThreadPoolExecutor(max_workers=_num_threads, thread_name_prefix="adf")
+    return _thread_pool
+
+def _parallel_grs(method) :
+    """Evaluates a reach evaluation method of an ADF on blocks of its gross ratings (the first argument) on the thread pool when more than one thread is set (see `set_num_threads`).
+
+    The method has to return one row per gross rating, the blocks are written into their rows of a preallocated result.
+    """
+    @functools.wraps(method)
+    def wrapper(self, grs, *args, **kwargs) :
+        grs = np.reshape(grs, [-1, self.n_dims])
+        block_size = _block_size
+        if _num_threads <= 1 or len(grs) <= block_size :
+            return method(self, grs, *args, **kwargs)
+
+        first  = method(self, grs[:block_size], *args, **kwargs)
+        result = np.empty([len(grs), *first.shape[1:]], dtype=first.dtype)
+        result[:block_size] = first
+
+        def evaluate_block(start) :
+            result[start:start+block_size] = method(self, grs[start:start+block_size], *args, **kwargs)
+
+        # consuming the results re-raises the exceptions of the blocks
+        list(_get_thread_pool().map(evaluate_block, range(block_size, len(grs), block_size)))
+        return result
+
+    return wrapper
@@ -27,9 +27,171 @@ import itertools
 from abc import ABC, abstractmethod
 
 from audience_modeling_toolbox.plotting import _plot_2d_reach
+from audience_modeling_toolbox.helpers import truncate_box, _max_freqs
+from audience_modeling_toolbox.model.cache import ReachCache, _memoized
+from audience_modeling_toolbox.model.config import get_default_dtype, _check_dtype, _parallel_grs
+
+def _freq_box(max_freq, n_dims) :
+    """All the frequency vectors in the box of [0, max_freq] in the `itertools.product` order. `max_freq` is an integer or a per dimension list.
+
+    Returns:
+        An integer array of shape (prod(max_freq_d+1), n_dims).
+    """
+    return np.indices(_max_freqs(max_freq, n_dims) + 1).reshape([n_dims, -1]).T
+
+def _cell_specs(cells, n_dims) :
+    """The distinct per dimension factors of a list of `(freqs, plus)` cell specifications.
+
+    Returns:
+        A tuple of `(freqs, plus, inverse)`, where `freqs` and `plus` of shape (n_factors, n_dims) are the distinct frequencies and reach_plus masks of each dimension (padded with exact zero frequencies) and `inverse` of shape (n_cells, n_dims) is the factor of each cell along each dimension.
+    """
+    freqs = np.array([np.broadcast_to(cell_freqs, [n_dims]) for cell_freqs, plus in cells], dtype=int)
+    plus  = np.array([np.broadcast_to(plus, [n_dims]) for cell_freqs, plus in cells], dtype=bool)
+
+    # the cells share most of their factors, e.g. the zero frequency of the other dimensions
+    factors = [np.unique(np.stack([freqs[:, d], plus[:, d]], axis=1), axis=0, return_inverse=True) for d in range(n_dims)]
+    n_factors = max(len(unique) for unique, inverse in factors)
+
+    unique_freqs = np.zeros([n_factors, n_dims], dtype=int)
+    unique_plus  = np.zeros([n_factors, n_dims], dtype=bool)
+    inverse      = np.empty([len(cells), n_dims], dtype=int)
+    for d, (unique, index) in enumerate(factors) :
+        unique_freqs[:len(unique), d] = unique[:, 0]
+        unique_plus[:len(unique), d]  = unique[:, 1]
+        inverse[:, d] = np.ravel(index)
+
+    return unique_freqs, unique_plus, inverse
+
+def _outer_box(tables, amplitudes=None) :
+    """The truncated reach box from the per dimension tables of a set of simple ADFs.
+
+    Args:
+        tables (list of numpy ndarray): For each dimension the table of shape (n_simples, n_grs, n_freqs_d) of that dimension's factor.
+        amplitudes (numpy vector): If given, the boxes of the simple ADFs are summed with these weights (in place by `einsum`).
+
+    Returns:
+        The boxes as an array of shape (n_grs, prod(n_freqs_d)), or (n_simples, n_grs, prod(n_freqs_d)) if `amplitudes` is None.
+    """
+    letters  = [chr(ord('A') + d) for d in range(len(tables))]
+    operands = ','.join(['ig' + letter for letter in letters])
+    output   = 'g' + ''.join(letters)
+    if amplitudes is None :
+        box = np.einsum(f"{operands}->i{output}", *tables)
+        return box.reshape([box.shape[0], box.shape[1], -1])
+    else :
+        box = np.einsum(f"i,{operands}->{output}", np.asarray(amplitudes, dtype=tables[0].dtype), *tables)
+        return box.reshape([box.shape[0], -1])
+
+def _split_tables(tables, max_freqs) :
+    """Splits a table of the frequencies [0, max(max_freqs)] (along axis -2) of every dimension (along axis -1) into the list of the tables of frequencies [0, max_freqs[d]] of each dimension."""
+    return [tables[..., :max_freq+1, d] for d, max_freq in enumerate(max_freqs)]
+
+def _truncate_table(pmfs, max_freqs) :
+    """The per dimension tables of the truncated reach from a table of pmfs (see `_split_tables`), where the last frequency of each dimension holds the reach_plus of its max_freq by a cumulative sum."""
+    tables = []
+    for d, max_freq in enumerate(max_freqs) :
+        table = pmfs[..., :max_freq+1, d].copy()
+        # the sum is accumulated in double precision, the reach_plus is a small difference for large max_freq
+        table[..., -1] = np.maximum(1 - np.sum(pmfs[..., :max_freq, d], axis=-1, dtype=np.float64), 0.0)
+        tables.append(table)
+    return tables
+
+def _log_outer_box(log_tables, log_amplitudes) :
+    """The logarithm of the truncated reach box from the per dimension log tables of a set of simple ADFs.
+
+    The boxes of the simple ADFs are accumulated one by one with `numpy.logaddexp`, so the result is exact even where the reach underflows.
+
+    Args:
+        log_tables (list of numpy ndarray): For each dimension the log table of shape (n_simples, n_grs, n_freqs_d).
+        log_amplitudes (numpy vector): The logarithm of the amplitudes of the simple ADFs.
+
+    Returns:
+        The log of the box as an array of shape (n_grs, prod(n_freqs_d)).
+    """
+    n_dims = len(log_tables)
+    n_grs  = log_tables[0].shape[1]
+
+    log_box = None
+    for i in range(len(log_amplitudes)) :
+        term = log_amplitudes[i]
+        for d, log_table in enumerate(log_tables) :
+            shape = [n_grs] + [1] * n_dims
+            shape[1 + d] = -1
+            term = term + np.reshape(log_table[i], shape)
+        log_box = term if log_box is None else np.logaddexp(log_box, term, out=log_box)
+
+    return np.reshape(log_box, [n_grs, -1])
+
+def _log_gammainc(a, x) :
+    """The logarithm of the regularized lower incomplete gamma function, accurate where `scipy.special.gammainc` underflows."""
+    a, x = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(x, dtype=float))
+    with np.errstate(divide="ignore") :
+        result = np.log(special.gammainc(a, x))
+    # P(0, x) = 1 for every x, including x = 0 where scipy returns nan
+    result[a == 0] = 0.0
+
+    # P(a, x) = x^a exp(-x) / Gamma(a+1) * sum_n x^n / ((a+1)...(a+n)), which converges fast where P underflows (x << a)
+    underflow = (result < -700) & (x > 0)
+    if np.any(underflow) :
+        a, x = a[underflow], x[underflow]
+        term, series = np.ones_like(x), np.ones_like(x)
+        for n in range(1, 10000) :
+            term = term * x / (a + n)
+            series = series + term
+            if np.all(term < 1.0e-17 * series) :
+                break
+        result[underflow] = special.xlogy(a, x) - x - special.gammaln(a + 1) + np.log(series)
+
+    return result
+
+def _convolve_dims(pmfs) :
+    """The distribution of the total frequency summed over independent dimensions.
+
+    Args:
+        pmfs (list of numpy ndarray): For each dimension the reach of frequencies [0, max_freq] along the first axis.
+
+    Returns:
+        The reach of the total frequencies [0, max_freq] along the first axis.
+    """
+    n_freqs  = pmfs[0].shape[0]
+    combined = pmfs[0]
+    for pmf in pmfs[1:] :
+        convolved = combined[0] * pmf
+        for f in range(1, n_freqs) :
+            convolved[f:] += combined[f] * pmf[:n_freqs-f]
+        combined = convolved
+
+    return combined
+
+def _subset_masks(subsets, n_dims) :
+    """The (n_subsets, n_dims) mask of the dimensions in each subset of dimensions, all the dimensions if `subsets` is None."""
+    if subsets is None :
+        return np.ones([1, n_dims])
+
+    masks = np.zeros([len(subsets), n_dims])
+    for i, dims in enumerate(subsets) :
+        masks[i, list(dims)] = 1.0
+    return masks
+
+def _check_k(k) :
+    """Raises a ValueError unless the minimum total frequency `k` (or each of them) of a k+ reach is an integer of at least 1."""
+    ks = np.asarray(k)
+    if ks.size == 0 or not np.issubdtype(ks.dtype, np.integer) or np.any(ks < 1) :
+        raise ValueError(f"The minimum total frequency k of the k+ reach has to be an integer of at least 1, not {k}.")
+
+def _sum_cells(factors, amplitudes) :
+    """The weighted sum over simple ADFs of the product over dimensions of `factors` with shape (n_simples, n_grs, n_freqs, n_dims)."""
+    operands = ','.join(['igf' for d in range(factors.shape[-1])])
+    return np.einsum(f"i,{operands}->gf", np.asarray(amplitudes, dtype=factors.dtype), *np.moveaxis(factors, -1, 0))
 
 class AbstractADF(ABC):
 
+    _cache = None
+    _dtype = None
+
+    # the (mixture, index) of a simple ADF that is a component of a MixtureADF, see `MixtureADF.simple_adfs`
+    _component = None
+
     @abstractmethod
     def _f_reach(self, grs, freqs) :
         pass
@@ -42,6 +204,77 @@ class AbstractADF(ABC):
     def _evaluate(self, xs) :
         pass
 
+    def enable_cache(self, max_bytes=2**27) :
+        """Enables a least recently used cache of `f_reach`, `fplus_reach` and `ftrunc_reach`, cleared whenever the parameters of the ADF are set.
+
+        Args:
+            max_bytes (int): The memory budget of the cached reaches in bytes (default 128MB).
+        """
+        self._cache = ReachCache(max_bytes)
+        return self
+
+    def disable_cache(self) :
+        """Disables and drops the cache of the reach evaluations."""
+        self._cache = None
+        return self
+
+    def cache_info(self) :
+        """The hit/miss statistics of the cache of the reach evaluations, or None if it is not enabled."""
+        return None if self._cache is None else self._cache.info()
+
+    def _invalidate_cache(self) :
+        if self._cache is not None :
+            self._cache.clear()
+
+    @property
+    def dtype(self) :
+        """The floating point type of the reach evaluations of the ADF, the global default (see `set_default_dtype`) unless it is set."""
+        return get_default_dtype() if self._dtype is None else self._dtype
+
+    @dtype.setter
+    def dtype(self, dtype) :
+        self._dtype = None if dtype is None else _check_dtype(dtype)
+        self._invalidate_cache()
+
+    @classmethod
+    def _f_reach_rates_peak(cls, lower, upper, freqs) :
+        """The maximum of the rate kernel `_f_reach_rates` over the rates [lower, upper], zero for the negative frequencies.
+
+        The pmf of the frequency k of the simple ADFs is unimodal in the rate with its mode at the rate k, so that its maximum over an interval is at the rate of the interval closest to k. The `_f_reach_rates_curvature` and `_fplus_reach_rates_curvature` kernels of the simple ADFs bound the absolute second derivative of the rate kernels over the interval by these maxima.
+        """
+        return (freqs >= 0) * np.exp(cls._log_f_reach_rates(np.clip(freqs, lower, upper), np.maximum(freqs, 0)))
+
+    def _component_parameters(self, parameters) :
+        """The parameters of a simple ADF, read from the stacked parameters of its mixture if it is a component of one.
+
+        The parameters are returned as a read-only view, so that they are only changed through the `parameters` setter, which writes them through to the mixture and invalidates the caches.
+        """
+        if self._component is not None :
+            mixture, index = self._component
+            parameters = mixture._stacked_parameters[index]
+        view = parameters.view()
+        view.flags.writeable = False
+        return view
+
+    def _store_parameters(self, parameters) :
+        """Writes the new parameters of a simple ADF through to the stacked parameters of its mixture if it is a component of one."""
+        if self._component is not None :
+            mixture, index = self._component
+            mixture._stacked_parameters[index] = parameters
+            mixture._invalidate_cache()
+        self._invalidate_cache()
+        return parameters
+
+    def _rates(self, grs) :
+        """The rates of a simple ADF, i.e. its parameters times the gross ratings, in the dtype of the ADF."""
+        return np.multiply(self.parameters, grs, dtype=self.dtype)
+
+    def _typed(self, values) :
+        """The `values` (e.g. frequencies) as an array of the dtype of the ADF."""
+        return np.asarray(values, dtype=self.dtype)
+
+    @_memoized
+    @_parallel_grs
     def f_reach(self, grs, freqs) :
         """Calculates the reach as a function of frequencies.
 
@@ -61,6 +294,8 @@ class AbstractADF(ABC):
             axis=2
         )
 
+    @_memoized
+    @_parallel_grs
     def fplus_reach(self, grs, freqs) :
         """Calculates the reach_plus as a function of frequencies.
 
@@ -80,6 +315,213 @@ class AbstractADF(ABC):
             axis=2
         )
 
+    @_parallel_grs
+    def cell_reach(self, grs, cells) :
+        """Calculates the reach of a few selected cells of the reach-frequency space, at a cost proportional to the number of cells rather than the size of the box.
+
+        For example the exclusive reach on the first of two dimensions is the cell `([1, 0], [True, False])` and the overlap of the two is `([1, 1], True)`.
+
+        Args:
+            grs (numpy ndarray): The gross ratings
+            cells (list of tuples): The `(freqs, plus)` of each cell, where `freqs` is the frequency of each dimension and `plus` (a bool or a list of bools per dimension) selects the reach_plus of the frequency, i.e. at least `freqs`, instead of the exact frequency.
+
+        Returns:
+            The reach of each cell as a numpy array of shape (n_grs, n_cells).
+        """
+        freqs, plus, inverse = _cell_specs(cells, self.n_dims)
+        grs     = np.reshape(grs, [-1, 1, self.n_dims])
+        factors = np.where(plus, self._fplus_reach(grs, freqs[np.newaxis]), self._f_reach(grs, freqs[np.newaxis]))
+        return np.prod(factors[:, inverse, np.arange(self.n_dims)], axis=2)
+
+    def log_f_reach(self, grs, freqs) :
+        """Calculates the logarithm of the reach as a function of frequencies. Unlike `f_reach` it does not overflow or underflow for large gross ratings or frequencies.
+
+        Args:
+            grs (numpy ndarray): The gross ratings
+            freqs (numpy ndarray): The frequencies
+
+        Returns:
+            The log of the reach for each frequency as a numpy array of shape (n_grs, n_freqs).
+        """
+
+        return np.sum(
+            self._log_f_reach(
+                np.reshape(grs,   [-1, 1, self.n_dims]),
+                np.reshape(freqs, [1, -1, self.n_dims])
+            ),
+            axis=2
+        )
+
+    def log_fplus_reach(self, grs, freqs) :
+        """Calculates the logarithm of the reach_plus as a function of frequencies. Unlike `fplus_reach` it does not overflow or underflow for large gross ratings or frequencies.
+
+        Args:
+            grs (numpy ndarray): The gross ratings
+            freqs (numpy ndarray): The frequencies
+
+        Returns:
+            The log of the reach_plus for each frequency as a numpy array of shape (n_grs, n_freqs).
+        """
+
+        return np.sum(
+            self._log_fplus_reach(
+                np.reshape(grs,   [-1, 1, self.n_dims]),
+                np.reshape(freqs, [1, -1, self.n_dims])
+            ),
+            axis=2
+        )
+
+    def kplus_reach(self, grs, k=1, subsets=None, block_size=2**12) :
+        """Calculates the k+ reach, i.e. the reach of the total frequency of at least `k` summed over the media, for a batch of media plans without generating the reach boxes.
+
+        Args:
+            grs (numpy ndarray): The gross ratings of the media plans of shape (n_plans, n_dims).
+            k (int): The minimum total frequency (default 1).
+            subsets (list of lists of int): If given, the k+ reach is calculated for each subset of the dimensions (media) separately.
+            block_size (int): The number of plans evaluated at a time.
+
+        Returns:
+            The k+ reach as a numpy array of shape (n_plans,) or (n_plans, n_subsets) if `subsets` is given.
+        """
+        _check_k(k)
+        grs   = np.reshape(grs, [-1, self.n_dims])
+        masks = _subset_masks(subsets, self.n_dims)
+
+        # a dimension out of a subset is the same as a dimension with zero gross rating
+        result = np.empty([grs.shape[0], masks.shape[0]])
+        for start in range(0, grs.shape[0], block_size) :
+            block = grs[start:start+block_size, np.newaxis, :] * masks
+            result[start:start+block_size] = 1 - np.sum(self._combined_f_reach(block, k - 1), axis=-1)
+
+        return result[:, 0] if subsets is None else result
+
+    def kplus_reach_gradient(self, grs, k=1, subsets=None, block_size=2**12) :
+        """Calculates the derivatives of `kplus_reach` with respect to the gross ratings of each dimension.
+
+        Args:
+            grs (numpy ndarray): The gross ratings of the media plans of shape (n_plans, n_dims).
+            k (int): The minimum total frequency (default 1).
+            subsets (list of lists of int): If given, the gradient is calculated for each subset of the dimensions (media) separately.
+            block_size (int): The number of plans evaluated at a time.
+
+        Returns:
+            The gradient as a numpy array of shape (n_plans, n_dims) or (n_plans, n_subsets, n_dims) if `subsets` is given.
+        """
+        _check_k(k)
+        grs   = np.reshape(grs, [-1, self.n_dims])
+        masks = _subset_masks(subsets, self.n_dims)
+
+        result = np.empty([grs.shape[0], masks.shape[0], self.n_dims])
+        for start in range(0, grs.shape[0], block_size) :
+            block = grs[start:start+block_size, np.newaxis, :] * masks
+            result[start:start+block_size] = -np.sum(self._combined_f_reach(block, k - 1, gradient=True), axis=-2) * masks
+
+        return result[:, 0, :] if subsets is None else result
+
+    def inverse_kplus_reach(self, reaches, k=1, splits=None, tol=1.0e-10, max_iter=100) :
+        """Calculates the gross ratings needed to hit target k+ reaches for a batch of targets.
+
+        The gross ratings of each target are the total gross rating times the (normalized) media split ratios. The total gross ratings are found by simultaneous safeguarded Newton steps over the whole batch, using the analytic derivatives of the reach, and falling back to bisection when a Newton step leaves the bracket of the solution.
+
+        Args:
+            reaches (numpy vector): The target k+ reaches, in [0, 1).
+            k (int or numpy vector of int): The minimum total frequency of each target (default 1).
+            splits (numpy ndarray): The media split ratios of shape (n_targets, n_dims) or (n_dims,). By default the gross ratings are split equally.
+            tol (float): The tolerance of the reach.
+            max_iter (int): The maximum number of Newton/bisection iterations.
+
+        Returns:
+            The gross ratings of shape (n_targets, n_dims). The targets that are not reachable with their split are `nan`.
+        """
+        reaches = np.atleast_1d(np.asarray(reaches, dtype=float))
+        n_targets = len(reaches)
+        _check_k(k)
+        if not np.all((reaches >= 0) & (reaches < 1)) :
+            raise ValueError(f"The target k+ reaches have to be in [0, 1), the reach of any finite gross rating is less than one: {reaches[~((reaches >= 0) & (reaches < 1))]}.")
+        ks = np.broadcast_to(np.asarray(k, dtype=int), [n_targets])
+        splits = np.ones(self.n_dims) if splits is None else np.asarray(splits, dtype=float)
+        splits = np.broadcast_to(splits, [n_targets, self.n_dims])
+        splits = splits / np.sum(splits, axis=1, keepdims=True)
+
+        def reach_and_slope(totals, index) :
+            reach, slope = np.empty(len(index)), np.empty(len(index))
+            for k_value in np.unique(ks[index]) :
+                same_k = ks[index] == k_value
+                grs = totals[same_k, np.newaxis] * splits[index[same_k]]
+                reach[same_k] = self.kplus_reach(grs, k_value)
+                slope[same_k] = np.sum(self.kplus_reach_gradient(grs, k_value) * splits[index[same_k]], axis=1)
+            return reach, slope
+
+        # bracket the total gross ratings by doubling the upper bound
+        lower, upper = np.zeros(n_targets), np.ones(n_targets)
+        active = np.flatnonzero((reaches > 0) & (reaches < 1))
+        for i in range(64) :
+            reach, _ = reach_and_slope(upper[active], active)
+            active = active[reach < reaches[active]]
+            if len(active) == 0 :
+                break
+            lower[active] = upper[active]
+            upper[active] *= 2
+        unreachable = np.zeros(n_targets, dtype=bool)
+        unreachable[active] = True
+
+        totals = np.where(reaches > 0, upper, 0.0)
+        active = np.flatnonzero((reaches > 0) & ~unreachable)
+        for i in range(max_iter) :
+            if len(active) == 0 :
+                break
+            reach, slope = reach_and_slope(totals[active], active)
+            error = reach - reaches[active]
+
+            converged = (np.abs(error) < tol) | (upper[active] - lower[active] < tol * upper[active])
+            lower[active] = np.where(error < 0, totals[active], lower[active])
+            upper[active] = np.where(error > 0, totals[active], upper[active])
+
+            with np.errstate(divide="ignore", invalid="ignore") :
+                newton = totals[active] - error / slope
+            bisection = (lower[active] + upper[active]) / 2
+            inside = (slope > 0) & (newton > lower[active]) & (newton < upper[active])
+            totals[active] = np.where(converged, totals[active], np.where(inside, newton, bisection))
+
+            active = active[~converged]
+
+        totals[unreachable] = np.nan
+        return totals[:, np.newaxis] * splits
+
+    def _combined_f_reach(self, grs, max_freq, gradient=False) :
+        """The reach of the total frequencies [0, max_freq] summed over the dimensions for `grs` of shape (..., n_dims).
+
+        If `gradient` is True returns the derivatives with respect to the gross rating of each dimension, of shape (..., max_freq+1, n_dims), instead.
+        """
+        grs    = np.asarray(grs)
+        tables = self._frequency_tables(np.reshape(grs, [-1, self.n_dims]), max_freq)
+
+        if gradient :
+            gradients = self._frequency_tables(np.reshape(grs, [-1, self.n_dims]), max_freq, gradient=True)
+            combined  = np.stack([
+                _convolve_dims(tables[:d] + [gradients[d]] + tables[d+1:])
+                for d in range(self.n_dims)
+            ], axis=-1)
+            return np.moveaxis(np.sum(combined, axis=1), 0, -2).reshape([*grs.shape[:-1], max_freq+1, self.n_dims])
+
+        combined = _convolve_dims(tables)
+        return np.moveaxis(np.sum(combined, axis=1), 0, -1).reshape([*grs.shape[:-1], max_freq+1])
+
+    def _frequency_tables(self, grs, max_freq, gradient=False) :
+        """For each dimension, the reach of frequencies [0, max_freq] of shape (max_freq+1, n_simples, n_grs) for `grs` of shape (n_grs, n_dims).
+
+        The frequencies are along the first axis and the gross ratings along the last (contiguous) axis. The amplitudes of the simple ADFs (here a single one) are folded into the first dimension. If `gradient` is True returns the derivatives with respect to the gross rating of each dimension instead.
+        """
+        tables = []
+        for d in range(self.n_dims) :
+            xs    = np.reshape(np.multiply(self.parameters[d], grs[:, d], dtype=self.dtype), [1, -1])
+            table = self._f_reach_rates_recurrence(xs, max_freq)
+            if gradient :
+                table = self.parameters[d] * self._f_reach_rates_recurrence_gradient(xs, table)
+            tables.append(table[:, np.newaxis, :])
+
+        return tables
+
     def evaluate(self, xs) :
         """Evaluates the ADF for the given rates
 
@@ -92,30 +534,151 @@ class AbstractADF(ABC):
 
         return self._evaluate(np.reshape(xs, [-1, self.n_dims]))
 
-    def ftrunc_reach(self, grs, max_freq) :
+    @_memoized
+    @_parallel_grs
+    def ftrunc_reach(self, grs, max_freq, method="recurrence") :
         """Calculates the reach as a function of frequencies in a box. That is for all frequencies from [0, max_freq-1] and calculate the reach_plus for max_freq. This can be used as the values of a dataframe to generate the RFReport.
 
         Args:
             grs (numpy ndarray): The gross ratings
-            max_freq (int): The maximum frequency of the box
+            max_freq (int or list of ints): The maximum frequency of the box, or of each dimension of the box
+            method (str): "recurrence" generates the reach of frequencies [0, max_freq] for each dimension by a running ratio and the reach_plus by a cumulative sum, "direct" evaluates the reach formulas for every frequency, and "log" evaluates them in log space which stays exact at any gross rating and frequency.
 
         Returns:
             The tuple of (reaches, freqs) that is the rf_dataframe values for the box of [0, max_freq].
         """
-        freqs = np.array(list(
-            itertools.product(*[range(max_freq+1) for i in range(self.n_dims)])
-            ))
-        R = self._f_reach(np.reshape(grs, [-1, 1, self.n_dims]),
-                          np.reshape(freqs, [1, -1, self.n_dims]))
+        return _outer_box(*self._box_tables(grs, max_freq, method=method))
+
+    def iter_ftrunc_reach(self, grs, max_freq, method="recurrence", max_bytes=2**26) :
+        """Generates the truncated reach box of `ftrunc_reach` in chunks of the frequencies, without allocating the whole box.
+
+        The chunks follow the `itertools.product` order of the frequencies, so concatenating them along the second axis gives the output of `ftrunc_reach`. Each chunk fixes the frequencies of the first dimensions and spans the box of the rest.
+
+        Args:
+            grs (numpy ndarray): The gross ratings
+            max_freq (int or list of ints): The maximum frequency of the box, or of each dimension of the box
+            method (str): The evaluation method, see `ftrunc_reach`.
+            max_bytes (int): The memory budget of a chunk in bytes (default 64MB). A chunk has at least one frequency vector for all the gross ratings.
+
+        Yields:
+            The reach of consecutive frequencies of the box as arrays of shape (n_grs, n_chunk_freqs).
+        """
+        tables, amplitudes = self._box_tables(grs, max_freq, method=method)
+        n_freqs = [table.shape[-1] for table in tables]
+
+        # the size of the boxes of the dimensions from d on, for all the gross ratings
+        n_bytes = tables[0].shape[1] * tables[0].dtype.itemsize * np.append(np.cumprod(n_freqs[::-1])[::-1], 1)
+        if n_bytes[0] <= max_bytes :
+            yield _outer_box(tables, amplitudes)
+            return
+
+        # the frequencies of the dimension `split` are chunked, the ones before it are fixed
+        split = min(int(np.sum(n_bytes > max_bytes)), len(tables)) - 1
+        step  = max(max_bytes // n_bytes[split+1], 1)
+        for prefix in itertools.product(*[range(n) for n in n_freqs[:split]]) :
+            factor = np.ones(tables[0].shape[:2])
+            for d, f in enumerate(prefix) :
+                factor = factor * tables[d][:, :, f]
+            for start in range(0, n_freqs[split], step) :
+                head = factor[:, :, np.newaxis] * tables[split][:, :, start:start+step]
+                yield _outer_box([head] + tables[split+1:], amplitudes)
+
+    def _box_tables(self, grs, max_freq, method="recurrence") :
+        """The per dimension tables of the simple ADFs of shape (n_simples, n_grs, max_freq_d+1) and their amplitudes, whose outer product is the truncated reach box."""
+        tables = self._ftrunc_tables(grs, max_freq, method=method)
+        return [table[np.newaxis] for table in tables], np.ones(1)
+
+    def ftrunc_reach_multi(self, grs, max_freqs, method="recurrence") :
+        """Calculates `ftrunc_reach` for several maximum frequencies from a single box. Only the box of the largest max_freq is evaluated by the model, the others are aggregated from it.
+
+        Args:
+            grs (numpy ndarray): The gross ratings
+            max_freqs (list): The maximum frequencies of the boxes, each an integer or a per dimension list
+            method (str): The evaluation method of the largest box, see `ftrunc_reach`.
+
+        Returns:
+            A dictionary of the reach box of each max_freq in `max_freqs` (the per dimension lists as tuples).
+        """
+        max_freq = np.max([_max_freqs(new_max_freq, self.n_dims) for new_max_freq in max_freqs], axis=0)
+        box = self.ftrunc_reach(grs, max_freq, method=method)
+        return {
+            (tuple(new_max_freq) if np.ndim(new_max_freq) else new_max_freq) : truncate_box(box, self.n_dims, max_freq, new_max_freq)
+            for new_max_freq in max_freqs
+        }
+
+    def log_ftrunc_reach(self, grs, max_freq) :
+        """Calculates the logarithm of `ftrunc_reach`. The cells that underflow in `ftrunc_reach` are still resolved here.
+
+        Args:
+            grs (numpy ndarray): The gross ratings
+            max_freq (int or list of ints): The maximum frequency of the box, or of each dimension of the box
+
+        Returns:
+            The log of the reach for the box of [0, max_freq] of shape (n_grs, prod(max_freq_d+1)).
+        """
+        log_tables = self._log_ftrunc_tables(grs, max_freq)
+        return _log_outer_box([log_table[np.newaxis] for log_table in log_tables], np.zeros(1))
 
-        R_truncate = self._fplus_reach(np.reshape(grs, [-1, 1, self.n_dims]),
-                                       max_freq * np.ones([1, 1, self.n_dims]))
-        for n_freq, n_dim in itertools.product(range((max_freq+1)**self.n_dims), range(self.n_dims)) :
-            if freqs[n_freq, n_dim] == max_freq :
-                for n_gr in range(R.shape[0]) :
-                    R[n_gr, n_freq, n_dim] = R_truncate[n_gr, 0, n_dim]
+    def ftrunc_reach_jacobian(self, grs, max_freq) :
+        """Calculates the derivatives of `ftrunc_reach` with respect to the parameters of the ADF.
+
+        Args:
+            grs (numpy ndarray): The gross ratings
+            max_freq (int or list of ints): The maximum frequency of the box, or of each dimension of the box
 
-        return np.prod(R, axis=2)
+        Returns:
+            The jacobian as a numpy array of shape (n_grs, prod(max_freq_d+1), n_dims), where the last axis is the derivative with respect to the parameter of each dimension.
+        """
+        R  = self._ftrunc_factors(grs, max_freq)
+        dR = self._ftrunc_factors(grs, max_freq, gradient=True)
+
+        # product of the factors of all the other dimensions, without dividing by the (possibly zero) factor itself
+        ones = np.ones_like(R[:, :, :1])
+        before = np.cumprod(np.concatenate([ones, R[:, :, :-1]], axis=2), axis=2)
+        after  = np.flip(np.cumprod(np.concatenate([ones, np.flip(R[:, :, 1:], axis=2)], axis=2), axis=2), axis=2)
+
+        return before * after * dR
+
+    def _ftrunc_tables(self, grs, max_freq, method="recurrence") :
+        """The list of the per dimension factors of the truncated reach box, each of shape (n_grs, max_freq_d+1)."""
+        grs = np.reshape(grs, [-1, 1, self.n_dims])
+        max_freqs = _max_freqs(max_freq, self.n_dims)
+        if method == "recurrence" :
+            return _truncate_table(self._f_reach_recurrence(grs, max_freqs.max()), max_freqs)
+        elif method == "direct" :
+            freqs = np.reshape(np.arange(max_freqs.max()+1), [1, -1, 1])
+            return _split_tables(np.where(freqs == max_freqs,
+                                          self._fplus_reach(grs, np.reshape(max_freqs, [1, 1, -1])),
+                                          self._f_reach(grs, freqs)), max_freqs)
+        elif method == "log" :
+            return [np.exp(log_table) for log_table in self._log_ftrunc_tables(grs, max_freq)]
+        else :
+            raise Exception(f"Unknown evaluation method {method}")
+
+    def _log_ftrunc_tables(self, grs, max_freq) :
+        """The list of the logarithm of the per dimension factors of the truncated reach box, each of shape (n_grs, max_freq_d+1)."""
+        grs = np.reshape(grs, [-1, 1, self.n_dims])
+        max_freqs  = _max_freqs(max_freq, self.n_dims)
+        log_tables = _split_tables(self._log_f_reach_recurrence(grs, max_freqs.max()), max_freqs)
+        log_plus   = self._log_fplus_reach(grs, np.reshape(max_freqs, [1, 1, -1]))
+        for d, log_table in enumerate(log_tables) :
+            log_table[..., -1] = log_plus[..., 0, d]
+        return log_tables
+
+    def _ftrunc_factors(self, grs, max_freq, gradient=False) :
+        """The per dimension factors of the truncated reach box (or their derivatives) of shape (n_grs, n_freqs, n_dims)."""
+        f_reach     = self._f_reach_gradient if gradient else self._f_reach
+        fplus_reach = self._fplus_reach_gradient if gradient else self._fplus_reach
+
+        max_freqs = _max_freqs(max_freq, self.n_dims)
+        freqs = _freq_box(max_freqs, self.n_dims)
+        R = f_reach(np.reshape(grs, [-1, 1, self.n_dims]),
+                    np.reshape(freqs, [1, -1, self.n_dims]))
+
+        R_truncate = fplus_reach(np.reshape(grs, [-1, 1, self.n_dims]),
+                                 np.reshape(max_freqs, [1, 1, self.n_dims]))
+        # The cells at the `max_freq` of a dimension hold the reach_plus of that dimension
+        return np.where(np.reshape(freqs == max_freqs, [1, -1, self.n_dims]), R_truncate, R)
 
     def plot_2d_reach(self, gr_values, dim_cols, max_freq, population_size, ax=None) :
         """Plot a two dimensional reach surface generated from adf reach function
@@ -137,7 +700,7 @@ class AbstractADF(ABC):
         return _plot_2d_reach(
             (
                 self.ftrunc_reach(gr_values, max_freq=max_freq) * population_size
-            ).reshape([max_freq+1, max_freq+1]),
+            ).reshape(_max_freqs(max_freq, self.n_dims) + 1),
             dim_cols, ax=ax
         )
 
@@ -162,33 +725,123 @@ class NormalExponentialADF(AbstractADF) :
 
     @property
     def parameters(self) :
-        return self._gammas
+        return self._component_parameters(self._gammas)
 
     @parameters.setter
     def parameters(self, gammas) :
         if not isinstance(gammas, np.ndarray) or gammas.shape != (self.n_dims,) :
             raise Exception("bad input gammas")
-        self._gammas = gammas
+        self._gammas = self._store_parameters(gammas)
 
     def randomize(self, rng=np.random.default_rng(None)) :
         gammas = rng.random(self.n_dims) * 10
         self.parameters = gammas
 
+    @staticmethod
+    def _f_reach_rates(xs, freqs) :
+        # the powers overflow early in single precision, they are evaluated in double precision
+        xs64 = np.asarray(xs, dtype=np.float64)
+        return (np.power(xs64, freqs) / np.power(1 + xs64, freqs + 1)).astype(np.result_type(xs), copy=False)
+
+    @staticmethod
+    def _fplus_reach_rates(xs, freqs) :
+        return np.power(xs / (1 + xs), freqs)
+
+    @staticmethod
+    def _f_reach_rates_recurrence(xs, max_freq) :
+        # f_0 = 1/(1+x) and f_k = f_{k-1} * x/(1+x)
+        tables = np.empty([*xs.shape[:-2], max_freq + 1, xs.shape[-1]], dtype=xs.dtype)
+        tables[..., :1, :] = 1 / (1 + xs)
+        if max_freq > 0 :
+            tables[..., 1:, :] = xs * tables[..., :1, :]
+            for k in range(1, max_freq + 1) :
+                tables[..., k, :] *= tables[..., k-1, :]
+        return tables
+
+    @staticmethod
+    def _log_f_reach_rates(xs, freqs) :
+        return special.xlogy(freqs, xs) - (freqs + 1) * np.log1p(xs)
+
+    @staticmethod
+    def _log_fplus_reach_rates(xs, freqs) :
+        return special.xlogy(freqs, xs) - freqs * np.log1p(xs)
+
+    @staticmethod
+    def _log_f_reach_rates_recurrence(xs, max_freq) :
+        # log f_0 = -log(1+x) and log f_k = log f_{k-1} + log(x) - log(1+x)
+        with np.errstate(divide="ignore") :
+            log_ratios = np.repeat(np.log(xs) - np.log1p(xs), max_freq + 1, axis=-2)
+        log_ratios[..., :1, :] = -np.log1p(xs)
+        return np.cumsum(log_ratios, axis=-2)
+
+    @staticmethod
+    def _f_reach_rates_recurrence_gradient(xs, tables) :
+        # d/dx f_k(x) = (k f_{k-1}(x) - (k+1) f_k(x)) / (1+x) for the tables of frequencies [0, max_freq]
+        freqs = np.reshape(np.arange(tables.shape[-2], dtype=tables.dtype), [-1, 1])
+        lower = np.zeros_like(tables)
+        lower[..., 1:, :] = tables[..., :-1, :]
+        return (freqs * lower - (freqs + 1) * tables) / (1 + xs)
+
+    @classmethod
+    def _f_reach_rates_gradient(cls, xs, freqs) :
+        # d/dx f_k(x) = (k f_{k-1}(x) - (k+1) f_k(x)) / (1+x)
+        f_lower = (freqs > 0) * np.exp(cls._log_f_reach_rates(xs, np.maximum(freqs - 1, 0)))
+        return (freqs * f_lower - (freqs + 1) * np.exp(cls._log_f_reach_rates(xs, freqs))) / (1 + xs)
+
+    @classmethod
+    def _fplus_reach_rates_gradient(cls, xs, freqs) :
+        # d/dx F_k(x) = k f_{k-1}(x) / (1+x)
+        f_lower = (freqs > 0) * np.exp(cls._log_f_reach_rates(xs, np.maximum(freqs - 1, 0)))
+        return freqs * f_lower / (1 + xs)
+
+    @classmethod
+    def _f_reach_rates_curvature(cls, lower, upper, freqs) :
+        # f_k'' = (k(k-1) f_{k-2} - 2k(k+1) f_{k-1} + (k+1)(k+2) f_k) / (1+x)^2
+        peak = lambda freqs : cls._f_reach_rates_peak(lower, upper, freqs)
+        return (freqs * (freqs - 1) * peak(freqs - 2) + 2 * freqs * (freqs + 1) * peak(freqs - 1) + (freqs + 1) * (freqs + 2) * peak(freqs)) / (1 + lower)**2
+
+    @classmethod
+    def _fplus_reach_rates_curvature(cls, lower, upper, freqs) :
+        # F_k'' = k ((k-1) f_{k-2} - (k+1) f_{k-1}) / (1+x)^2
+        peak = lambda freqs : cls._f_reach_rates_peak(lower, upper, freqs)
+        return freqs * ((freqs - 1) * peak(freqs - 2) + (freqs + 1) * peak(freqs - 1)) / (1 + lower)**2
+
+    @staticmethod
+    def _evaluate_parameters(gammas, xs) :
+        return np.prod(np.exp(-xs/gammas)/gammas, axis=-1)
+
     def _f_reach(self, grs, freqs) :
-        return np.power(self._gammas*grs, freqs) / np.power(1 + self._gammas*grs, freqs + 1)
+        return self._f_reach_rates(self._rates(grs), self._typed(freqs))
 
     def _fplus_reach(self, grs, freqs) :
-        return np.power((self._gammas*grs) / (1+ self._gammas*grs), freqs)
+        return self._fplus_reach_rates(self._rates(grs), self._typed(freqs))
+
+    def _f_reach_recurrence(self, grs, max_freq) :
+        return self._f_reach_rates_recurrence(self._rates(grs), max_freq)
+
+    def _log_f_reach(self, grs, freqs) :
+        return self._log_f_reach_rates(self.parameters*grs, freqs)
+
+    def _log_fplus_reach(self, grs, freqs) :
+        return self._log_fplus_reach_rates(self.parameters*grs, freqs)
+
+    def _log_f_reach_recurrence(self, grs, max_freq) :
+        return self._log_f_reach_rates_recurrence(self.parameters*grs, max_freq)
+
+    def _f_reach_gradient(self, grs, freqs) :
+        return self._typed(grs) * self._f_reach_rates_gradient(self._rates(grs), self._typed(freqs))
+
+    def _fplus_reach_gradient(self, grs, freqs) :
+        return self._typed(grs) * self._fplus_reach_rates_gradient(self._rates(grs), self._typed(freqs))
 
     def _evaluate(self, xs) :
-        gammas = np.reshape(self._gammas, [1, self.n_dims])
-        return np.prod(np.exp(-xs/gammas)/gammas, axis=1)
+        return self._evaluate_parameters(np.reshape(self.parameters, [1, self.n_dims]), xs)
 
     def marginal(self, dims) :
         return type(self)(self.parameters[dims])
 
     def partial_evaluate(self, dims, values) :
-        eval_gammas = np.reshape(self._gammas[dims], [1, len(dims)])
+        eval_gammas = np.reshape(self.parameters[dims], [1, len(dims)])
         np.prod(np.exp(-values/eval_gammas)/eval_gammas)
         dims_to_marginal = [d for d in list(range(self.n_dims)) if d not in dims]
 
@@ -196,7 +849,7 @@ class NormalExponentialADF(AbstractADF) :
         if self.n_dims > 1 :
             raise Exception("cdf method is only defined for a single dimension.")
 
-        return 1 - np.exp(-value/self._gammas)
+        return 1 - np.exp(-value/self.parameters)
 
 class NormalDeltaADF(AbstractADF) :
     """The class for normalized simple delta function ADF."""
@@ -219,23 +872,120 @@ class NormalDeltaADF(AbstractADF) :
 
     @property
     def parameters(self) :
-        return self._positions
+        return self._component_parameters(self._positions)
 
     @parameters.setter
     def parameters(self, positions) :
         if not isinstance(positions, np.ndarray) or positions.shape != (self.n_dims,) :
             raise Exception("bad input positions")
-        self._positions = positions
+        self._positions = self._store_parameters(positions)
 
     def randomize(self, rng=np.random.default_rng(None)) :
         positions = rng.random(self.n_dims) * 10
         self.parameters = positions
 
+    @staticmethod
+    def _f_reach_rates(xs, freqs) :
+        # the powers and the gamma function overflow for large rates and frequencies, the pmf is evaluated from its logarithm in double precision
+        xs64 = np.asarray(xs, dtype=np.float64)
+        return np.exp(NormalDeltaADF._log_f_reach_rates(xs64, np.asarray(freqs, dtype=np.float64))).astype(np.result_type(xs), copy=False)
+
+    @staticmethod
+    def _fplus_reach_rates(xs, freqs) :
+        # the incomplete gamma function is evaluated in double precision, with P(0, x) = 1 also at x = 0 where scipy returns nan
+        freqs = np.asarray(freqs, dtype=np.float64)
+        return np.where(freqs == 0, 1.0, 1 - special.gammaincc(freqs, np.asarray(xs, dtype=np.float64))).astype(np.result_type(xs), copy=False)
+
+    @staticmethod
+    def _f_reach_rates_recurrence(xs, max_freq) :
+        # f_0 = exp(-x) and f_k = f_{k-1} * x/k
+        tables = np.empty([*xs.shape[:-2], max_freq + 1, xs.shape[-1]], dtype=xs.dtype)
+        tables[..., :1, :] = np.exp(-xs)
+        if max_freq > 0 :
+            tables[..., 1:, :] = xs / np.reshape(np.arange(1, max_freq + 1), [-1, 1])
+            for k in range(1, max_freq + 1) :
+                tables[..., k, :] *= tables[..., k-1, :]
+
+        # exp(-x) underflows for large rates (x > 708 in double precision), the recurrence is then carried out in log space
+        large = xs > -np.log(np.finfo(tables.dtype).tiny)
+        if np.any(large) :
+            log_tables = NormalDeltaADF._log_f_reach_rates_recurrence(np.asarray(xs, dtype=np.float64), max_freq)
+            tables = np.where(large, np.exp(log_tables), tables).astype(tables.dtype, copy=False)
+        return tables
+
+    @staticmethod
+    def _log_f_reach_rates(xs, freqs) :
+        return special.xlogy(freqs, xs) - xs - special.gammaln(freqs + 1)
+
+    @staticmethod
+    def _log_fplus_reach_rates(xs, freqs) :
+        return _log_gammainc(freqs, xs)
+
+    @staticmethod
+    def _log_f_reach_rates_recurrence(xs, max_freq) :
+        # log f_0 = -x and log f_k = log f_{k-1} + log(x) - log(k)
+        with np.errstate(divide="ignore") :
+            log_ratios = np.log(np.repeat(xs, max_freq + 1, axis=-2) / np.reshape(np.maximum(np.arange(max_freq + 1), 1), [-1, 1]))
+        log_ratios[..., :1, :] = -xs
+        return np.cumsum(log_ratios, axis=-2)
+
+    @staticmethod
+    def _f_reach_rates_recurrence_gradient(xs, tables) :
+        # d/dx f_k(x) = f_{k-1}(x) - f_k(x) for the tables of frequencies [0, max_freq]
+        lower = np.zeros_like(tables)
+        lower[..., 1:, :] = tables[..., :-1, :]
+        return lower - tables
+
+    @classmethod
+    def _f_reach_rates_gradient(cls, xs, freqs) :
+        # d/dx f_k(x) = f_{k-1}(x) - f_k(x)
+        f_lower = (freqs > 0) * np.exp(cls._log_f_reach_rates(xs, np.maximum(freqs - 1, 0)))
+        return f_lower - np.exp(cls._log_f_reach_rates(xs, freqs))
+
+    @classmethod
+    def _fplus_reach_rates_gradient(cls, xs, freqs) :
+        # d/dx F_k(x) = f_{k-1}(x)
+        return (freqs > 0) * np.exp(cls._log_f_reach_rates(xs, np.maximum(freqs - 1, 0)))
+
+    @classmethod
+    def _f_reach_rates_curvature(cls, lower, upper, freqs) :
+        # f_k'' = f_{k-2} - 2 f_{k-1} + f_k
+        peak = lambda freqs : cls._f_reach_rates_peak(lower, upper, freqs)
+        return peak(freqs - 2) + 2 * peak(freqs - 1) + peak(freqs)
+
+    @classmethod
+    def _fplus_reach_rates_curvature(cls, lower, upper, freqs) :
+        # F_k'' = f_{k-2} - f_{k-1}
+        peak = lambda freqs : cls._f_reach_rates_peak(lower, upper, freqs)
+        return peak(freqs - 2) + peak(freqs - 1)
+
+    @staticmethod
+    def _evaluate_parameters(positions, xs) :
+        pass
+
     def _f_reach(self, grs, freqs) :
-        return np.power(self._positions*grs, freqs) * np.exp(-self._positions * grs) / special.gamma(freqs + 1)
+        return self._f_reach_rates(self._rates(grs), self._typed(freqs))
 
     def _fplus_reach(self, grs, freqs) :
-        return 1 - special.gammaincc(freqs, self._positions*grs)
+        return self._fplus_reach_rates(self._rates(grs), self._typed(freqs))
+
+    def _f_reach_recurrence(self, grs, max_freq) :
+        return self._f_reach_rates_recurrence(self._rates(grs), max_freq)
+
+    def _log_f_reach(self, grs, freqs) :
+        return self._log_f_reach_rates(self.parameters*grs, freqs)
+
+    def _log_fplus_reach(self, grs, freqs) :
+        return self._log_fplus_reach_rates(self.parameters*grs, freqs)
+
+    def _log_f_reach_recurrence(self, grs, max_freq) :
+        return self._log_f_reach_rates_recurrence(self.parameters*grs, max_freq)
+
+    def _f_reach_gradient(self, grs, freqs) :
+        return self._typed(grs) * self._f_reach_rates_gradient(self._rates(grs), self._typed(freqs))
+
+    def _fplus_reach_gradient(self, grs, freqs) :
+        return self._typed(grs) * self._fplus_reach_rates_gradient(self._rates(grs), self._typed(freqs))
 
     def _evaluate(self, xs) :
         pass
@@ -251,6 +1001,6 @@ class NormalDeltaADF(AbstractADF) :
 
     def average_activity(self, dim=None) :
         if dim is None :
-            return self._positions
+            return self.parameters
         else :
-            return self._positions[dim]
\ No newline at end of file
+            return self.parameters[dim]
\ No newline at end of file
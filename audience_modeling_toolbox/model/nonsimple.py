@@ -23,12 +23,19 @@
 import numpy as np
 import pandas as pd
 import scipy
-from scipy.optimize import least_squares
+from scipy import special
+from scipy.optimize import least_squares, lsq_linear, minimize
 
+import copy
 import itertools
 import warnings
+import multiprocessing
 
-from audience_modeling_toolbox.model.models import AbstractADF, NormalExponentialADF, NormalDeltaADF
+from audience_modeling_toolbox.model.cache import _memoized
+from audience_modeling_toolbox.model.config import _parallel_grs
+from audience_modeling_toolbox.model.training import TrainingProblem, _fit_start, _fit_start_task
+from audience_modeling_toolbox.model.models import AbstractADF, NormalExponentialADF, NormalDeltaADF, _outer_box, _convolve_dims, _log_outer_box, _sum_cells, _truncate_table, _split_tables, _cell_specs
+from audience_modeling_toolbox.helpers import _max_freqs
 from audience_modeling_toolbox.audience import VirtualSociety
 
 class MixtureADF(AbstractADF) :
@@ -70,20 +77,57 @@ class MixtureADF(AbstractADF) :
            or amplitudes.shape != (self.n_simples,):
             raise Exception(f"Invalid amplitudes {amplitudes}")
         self._amplitudes = amplitudes
+        self._invalidate_cache()
+
+    @property
+    def simple_adfs(self) :
+        """The list of simple ADFs of the mixture, with the bounds they were created with.
+
+        They are the components of the mixture rather than copies: their parameters are read from and written to the stacked parameters of the mixture, e.g. setting `simple_adfs[i].parameters` changes the mixture.
+        """
+        return list(self._simple_adfs)
+
+    @simple_adfs.setter
+    def simple_adfs(self, simple_adfs) :
+        if len(simple_adfs) != self.n_simples :
+            raise Exception("The number of amplitudes and adfs don't match.")
+
+        # The mixture keeps its own copy of each simple ADF, so that a simple ADF given to several mixtures
+        # (or a component of another mixture) is not shared between them.
+        components = []
+        for simple_adf in simple_adfs :
+            component = copy.copy(simple_adf)
+            component._component, component._cache = None, None
+            component = copy.deepcopy(component)
+            component.parameters = np.array(simple_adf.parameters)
+            components.append(component)
+
+        # All the parameters are kept in a single (n_simples, n_dims) array and the simple
+        # ADFs are grouped by their type so that each group is evaluated in one broadcasted kernel.
+        self._stacked_parameters = np.array([component.parameters for component in components], dtype=float)
+        self._simple_adfs = components
+        for i, component in enumerate(components) :
+            component._component = (self, i)
+
+        self._simple_types = [type(simple_adf) for simple_adf in simple_adfs]
+        self._groups = [
+            (simple_type, np.array([i for i, t in enumerate(self._simple_types) if t is simple_type]))
+            for simple_type in dict.fromkeys(self._simple_types)
+        ]
+        self._bounds = {
+            which : [bound for simple_adf in simple_adfs for bound in simple_adf.bounds[which]]
+            for which in ("lower", "upper")
+        }
+        self._invalidate_cache()
 
     @property
     def parameters(self) :
-        return np.hstack([
-            simple_adf.parameters for simple_adf in self.simple_adfs
-        ]).flatten()
+        return self._stacked_parameters.flatten()
 
     @parameters.setter
     def parameters(self, parameters) :
-        index = 0
-        for simple_adf in self.simple_adfs :
-            n = len(simple_adf.parameters)
-            simple_adf.parameters = parameters[index: index+n]
-            index += n
+        self._stacked_parameters = np.reshape(np.array(parameters, dtype=float), [self.n_simples, self.n_dims])
+        self._invalidate_cache()
 
     def randomize(self, rng=np.random.default_rng(None)) :
         """Randomize the paramters of the mixture ADF."""
@@ -91,86 +135,440 @@ class MixtureADF(AbstractADF) :
         amplitudes.sort()
         self.amplitudes = np.flip(amplitudes) / np.sum(amplitudes)
 
-        for simple_adf in self.simple_adfs :
+        simple_adfs = self.simple_adfs
+        for simple_adf in simple_adfs :
             simple_adf.randomize(rng)
+        self.parameters = np.hstack([simple_adf.parameters for simple_adf in simple_adfs])
 
     def normalize(self) :
         """Normalize the amplitude of the mixture of ADFs to sum up to 1."""
         self.amplitudes = self.amplitudes/np.sum(self.amplitudes)
         return self
 
-    ### TODO: the below three functions are all linear. Can they be merged into one?
+    def _component_rates(self, index, grs, parameters=None) :
+        """The rates of the simple ADFs at `index` of shape (..., len(index), n_grs, n_freqs, n_dims) in the dtype of the ADF.
+
+        The `parameters` (default the parameters of the ADF) can be stacked of shape (..., n_simples, n_dims), with the gross ratings of shape (..., n_grs, n_freqs, n_dims), for a batch of mixtures of the same simple ADF types (see `BatchTrainer`).
+        """
+        parameters = self._stacked_parameters if parameters is None else parameters
+        return np.multiply(parameters[..., index, np.newaxis, np.newaxis, :], np.expand_dims(grs, -4), dtype=self.dtype)
+
+    def _component_factors(self, grs, freqs, kernel="_f_reach_rates", parameters=None) :
+        """Evaluates a reach `kernel` of every simple ADF at once.
+
+        Args:
+            grs (numpy ndarray): The gross ratings, broadcastable to (..., n_grs, n_freqs, n_dims)
+            freqs (numpy ndarray): The frequencies, broadcastable to (..., n_grs, n_freqs, n_dims)
+            kernel (str): The name of the rate kernel of the simple ADF types.
+            parameters (numpy ndarray): The stacked parameters of a batch of mixtures, see `_component_rates`.
+
+        Returns:
+            The per dimension factors of shape (..., n_simples, n_grs, n_freqs, n_dims).
+        """
+        grs, freqs = np.broadcast_arrays(grs, self._typed(freqs))
+        factors = np.empty([*grs.shape[:-3], self.n_simples, *grs.shape[-3:]], dtype=self.dtype)
+        for simple_type, index in self._groups :
+            xs = self._component_rates(index, grs, parameters)
+            factors[..., index, :, :, :] = getattr(simple_type, kernel)(xs, np.expand_dims(freqs, -4))
+
+        return factors
+
+    def _component_tables(self, grs, max_freq, gradient=False, method="recurrence", parameters=None) :
+        """The per dimension factors of the truncated reach box of every simple ADF.
+
+        Args:
+            grs (numpy ndarray): The gross ratings, of shape (..., n_grs, n_dims) with stacked `parameters`
+            max_freq (int or list of ints): The maximum frequency of the box, or of each dimension of the box
+            gradient (bool): If True returns the derivatives of the factors with respect to the parameters instead.
+            method (str): "recurrence", "direct" or "log", see `ftrunc_reach`. The derivatives are always evaluated directly.
+            parameters (numpy ndarray): The stacked parameters of shape (..., n_simples, n_dims) of a batch of mixtures of the same simple ADF types (default the parameters of the ADF), see `_component_rates`.
+
+        Returns:
+            The list of the tables of each dimension of shape (..., n_simples, n_grs, max_freq_d+1).
+        """
+        batch = () if parameters is None else np.shape(parameters)[:-2]
+        grs   = np.reshape(grs, [*batch, -1, 1, self.n_dims])
+        max_freqs = _max_freqs(max_freq, self.n_dims)
+
+        if method == "recurrence" and not gradient :
+            tables = np.empty([*batch, self.n_simples, grs.shape[-3], max_freqs.max()+1, self.n_dims], dtype=self.dtype)
+            for simple_type, index in self._groups :
+                xs = self._component_rates(index, grs, parameters)
+                tables[..., index, :, :, :] = simple_type._f_reach_rates_recurrence(xs, max_freqs.max())
+            return _truncate_table(tables, max_freqs)
+
+        elif method == "log" and not gradient :
+            if parameters is not None :
+                raise Exception("The log tables of stacked parameters aren't supported.")
+            return [np.exp(log_table) for log_table in self._component_log_tables(grs, max_freqs)]
+
+        elif method not in ("recurrence", "direct", "log") :
+            raise Exception(f"Unknown evaluation method {method}")
+
+        freqs = np.reshape(np.arange(max_freqs.max()+1), [1, -1, 1])
+        suffix = "_gradient" if gradient else ""
+
+        tables = np.where(
+            np.reshape(freqs == max_freqs, [1, 1, -1, self.n_dims]),
+            self._component_factors(grs, np.reshape(max_freqs, [1, 1, self.n_dims]), kernel="_fplus_reach_rates" + suffix, parameters=parameters),
+            self._component_factors(grs, freqs, kernel="_f_reach_rates" + suffix, parameters=parameters)
+        )
+        if gradient :
+            tables = tables * self._typed(np.expand_dims(grs, -4))
+
+        return _split_tables(tables, max_freqs)
+
+    def _component_log_tables(self, grs, max_freq) :
+        """The list of the logarithm of the per dimension factors of the truncated reach box of every simple ADF, each of shape (n_simples, n_grs, max_freq_d+1)."""
+        grs = np.reshape(grs, [-1, 1, self.n_dims])
+        max_freqs = _max_freqs(max_freq, self.n_dims)
+
+        log_tables = np.empty([self.n_simples, grs.shape[0], max_freqs.max()+1, self.n_dims])
+        for simple_type, index in self._groups :
+            xs = np.reshape(self._stacked_parameters[index], [-1, 1, 1, self.n_dims]) * grs
+            log_tables[index] = simple_type._log_f_reach_rates_recurrence(xs, max_freqs.max())
+            log_plus = simple_type._log_fplus_reach_rates(xs, max_freqs)
+            for d, max_freq in enumerate(max_freqs) :
+                log_tables[index, :, max_freq, d] = log_plus[:, :, 0, d]
+
+        return _split_tables(log_tables, max_freqs)
+
+    def _frequency_tables(self, grs, max_freq, gradient=False) :
+        tables = []
+        for d in range(self.n_dims) :
+            table = np.empty([max_freq+1, self.n_simples, grs.shape[0]], dtype=self.dtype)
+            for simple_type, index in self._groups :
+                parameters = np.reshape(self._stacked_parameters[index, d], [-1, 1])
+                xs = np.reshape(np.multiply(parameters, grs[:, d], dtype=self.dtype), [1, -1])
+                values = simple_type._f_reach_rates_recurrence(xs, max_freq)
+                if gradient :
+                    values = simple_type._f_reach_rates_recurrence_gradient(xs, values)
+                table[:, index, :] = values.reshape([max_freq+1, len(index), -1])
+                if gradient :
+                    table[:, index, :] *= parameters
+            tables.append(table)
+
+        tables[0] *= np.reshape(self._typed(self.amplitudes), [-1, 1])
+        return tables
+
     def _f_reach(self, grs, freqs) :
-        return np.tensordot(
-            self.amplitudes,
-            np.array([simple_adf._f_reach(grs, freqs) for simple_adf in self.simple_adfs]),
-            axes = ([0], [0])
-            )
+        return np.tensordot(self._typed(self.amplitudes), self._component_factors(grs, freqs), axes=([0], [0]))
 
     def _fplus_reach(self, grs, freqs) :
-        return np.tensordot(
-            self.amplitudes,
-            np.array([simple_adf._fplus_reach(grs, freqs) for simple_adf in self.simple_adfs]),
-            axes = ([0], [0])
-            )
+        return np.tensordot(self._typed(self.amplitudes), self._component_factors(grs, freqs, kernel="_fplus_reach_rates"), axes=([0], [0]))
+
+    @_memoized
+    @_parallel_grs
+    def f_reach(self, grs, freqs) :
+        return _sum_cells(
+            self._component_factors(np.reshape(grs, [-1, 1, self.n_dims]), np.reshape(freqs, [1, -1, self.n_dims])),
+            self.amplitudes
+        )
 
-    def ftrunc_reach(self, grs, max_freq) :
-        return np.tensordot(
-            self.amplitudes,
-            np.array([simple_adf.ftrunc_reach(grs, max_freq) for simple_adf in self.simple_adfs]),
-            axes = ([0], [0])
+    @_memoized
+    @_parallel_grs
+    def fplus_reach(self, grs, freqs) :
+        return _sum_cells(
+            self._component_factors(np.reshape(grs, [-1, 1, self.n_dims]), np.reshape(freqs, [1, -1, self.n_dims]),
+                                    kernel="_fplus_reach_rates"),
+            self.amplitudes
+        )
+
+    @_parallel_grs
+    def cell_reach(self, grs, cells) :
+        freqs, plus, inverse = _cell_specs(cells, self.n_dims)
+        grs     = np.reshape(grs, [-1, 1, self.n_dims])
+        factors = np.where(plus,
+                           self._component_factors(grs, freqs[np.newaxis], kernel="_fplus_reach_rates"),
+                           self._component_factors(grs, freqs[np.newaxis]))
+        return _sum_cells(factors[:, :, inverse, np.arange(self.n_dims)], self.amplitudes)
+
+    def log_f_reach(self, grs, freqs) :
+        return special.logsumexp(
+            np.sum(self._component_factors(np.reshape(grs, [-1, 1, self.n_dims]), np.reshape(freqs, [1, -1, self.n_dims]),
+                                           kernel="_log_f_reach_rates"), axis=3),
+            axis=0, b=np.reshape(self.amplitudes, [-1, 1, 1])
+        )
+
+    def log_fplus_reach(self, grs, freqs) :
+        return special.logsumexp(
+            np.sum(self._component_factors(np.reshape(grs, [-1, 1, self.n_dims]), np.reshape(freqs, [1, -1, self.n_dims]),
+                                           kernel="_log_fplus_reach_rates"), axis=3),
+            axis=0, b=np.reshape(self.amplitudes, [-1, 1, 1])
+        )
+
+    def _box_tables(self, grs, max_freq, method="recurrence") :
+        return self._component_tables(grs, max_freq, method=method), self.amplitudes
+
+    def _component_ftrunc_reach(self, grs, max_freq, method="recurrence") :
+        """The truncated reach boxes of every simple ADF of shape (n_simples, n_grs, prod(max_freq_d+1))."""
+        return _outer_box(self._component_tables(grs, max_freq, method=method))
+
+    def log_ftrunc_reach(self, grs, max_freq) :
+        log_tables = self._component_log_tables(grs, max_freq)
+        return _log_outer_box(log_tables, np.log(self.amplitudes))
+
+    def aggregate_ftrunc_reach(self, grs, groups, max_freq, method="recurrence") :
+        """Calculates the truncated reach box of aggregated dimensions without generating the box of all the dimensions.
+
+        Each group of dimensions is collapsed into a single dimension whose frequency is the sum of the frequencies of the group (as in `RFReport.combine_dims`), and the dimensions in none of the groups are marginalized. As every simple ADF factorizes across the dimensions, the frequency of a group is a convolution of the tables of its dimensions, so the cost is of order `n_simples * n_dims * max_freq**2` on top of the box of the groups.
+
+        Args:
+            grs (numpy ndarray): The gross ratings of all the dimensions
+            groups (list of lists of int): The disjoint groups of dimensions.
+            max_freq (int or list of ints): The maximum frequency of the box, or of each group
+            method (str): The evaluation method of the tables of the dimensions, see `ftrunc_reach`.
+
+        Returns:
+            The reach for the box of [0, max_freq] of the groups of shape (n_grs, prod(max_freq_g+1)).
+        """
+        dims = [d for group in groups for d in group]
+        if len(set(dims)) != len(dims) or not all(0 <= d < self.n_dims for d in dims) :
+            raise Exception(f"The groups {groups} should be disjoint subsets of the {self.n_dims} dimensions.")
+
+        max_freqs = _max_freqs(max_freq, len(groups))
+        tables = self._component_tables(grs, max_freqs.max(), method=method)
+
+        # The frequencies below max_freq only involve the exact frequencies of the tables, the reach_plus of each group is completed after the convolution
+        pmfs = np.empty([self.n_simples, tables[0].shape[1], max_freqs.max()+1, len(groups)], dtype=tables[0].dtype)
+        for g, group in enumerate(groups) :
+            pmfs[:, :, :max_freqs[g]+1, g] = np.moveaxis(
+                _convolve_dims([np.moveaxis(tables[d][:, :, :max_freqs[g]+1], -1, 0) for d in group]), 0, -1
             )
 
+        return _outer_box(_truncate_table(pmfs, max_freqs), self.amplitudes)
+
+    def combined_ftrunc_reach(self, grs, max_freq, dims=None, method="recurrence") :
+        """Calculates the truncated reach of the total frequency summed over `dims` (all the dimensions if None), of shape (n_grs, max_freq+1). See `aggregate_ftrunc_reach`."""
+        return self.aggregate_ftrunc_reach(grs, [list(range(self.n_dims)) if dims is None else list(dims)], max_freq, method=method)
+
+    def marginal_ftrunc_reach(self, grs, dims, max_freq, method="recurrence") :
+        """Calculates the truncated reach box of the dimensions `dims` only, marginalizing all the other dimensions. See `aggregate_ftrunc_reach`."""
+        return self.aggregate_ftrunc_reach(grs, [[d] for d in dims], max_freq, method=method)
+
+    def _combined_components(self, grs, max_freq, dims=None, gradient=False) :
+        """The truncated reach of the total frequency over `dims` of every simple ADF, see `combined_ftrunc_reach`.
+
+        Returns:
+            The reach of shape (n_simples, n_grs, max_freq+1), and if `gradient` is True also its derivatives with respect to the parameters of shape (n_simples, n_grs, max_freq+1, n_dims).
+        """
+        dims   = list(range(self.n_dims)) if dims is None else list(dims)
+        tables = self._component_tables(grs, max_freq)
+        pmfs   = [np.moveaxis(tables[d], -1, 0) for d in dims]
+        combined = _truncate_table(np.moveaxis(_convolve_dims(pmfs), 0, -1)[..., np.newaxis], [max_freq])[0]
+        if not gradient :
+            return combined
+
+        # the derivative of the total frequency replaces the table of one dimension by its derivative, the reach_plus is one minus the lower frequencies
+        gradients   = self._component_tables(grs, max_freq, gradient=True)
+        derivatives = np.zeros([*combined.shape, self.n_dims])
+        for i, d in enumerate(dims) :
+            derivative = np.moveaxis(_convolve_dims(pmfs[:i] + [np.moveaxis(gradients[d], -1, 0)] + pmfs[i+1:]), 0, -1)
+            derivatives[..., :-1, d] = derivative[..., :-1]
+            derivatives[..., -1, d]  = -np.sum(derivative[..., :-1], axis=-1)
+
+        return combined, derivatives
+
+    def combined_ftrunc_reach_jacobian(self, grs, max_freq, dims=None) :
+        """Calculates the derivatives of `combined_ftrunc_reach` with respect to the amplitudes and the parameters of the mixture.
+
+        Returns:
+            The jacobian as a numpy array of shape (n_grs, max_freq+1, n_simples + n_parameters), see `ftrunc_reach_jacobian`.
+        """
+        combined, derivatives = self._combined_components(grs, max_freq, dims=dims, gradient=True)
+        derivatives = derivatives * np.reshape(self.amplitudes, [-1, 1, 1, 1])
+        return np.concatenate([
+            np.moveaxis(combined, 0, -1),
+            np.moveaxis(derivatives, 0, -2).reshape([*combined.shape[1:], -1])
+        ], axis=2)
+
+    def ftrunc_reach_jacobian(self, grs, max_freq) :
+        """Calculates the derivatives of `ftrunc_reach` with respect to the amplitudes and the parameters of the mixture.
+
+        Args:
+            grs (numpy ndarray): The gross ratings
+            max_freq (int or list of ints): The maximum frequency of the box, or of each dimension of the box
+
+        Returns:
+            The jacobian as a numpy array of shape (n_grs, prod(max_freq_d+1), n_simples + n_parameters), where the last axis follows the order of `[*amplitudes, *parameters]`.
+        """
+        tables    = self._component_tables(grs, max_freq)
+        gradients = self._component_tables(grs, max_freq, gradient=True)
+
+        amplitudes_jacobian = _outer_box(tables)
+        parameters_jacobian = np.stack([
+            _outer_box(tables[:d] + [gradients[d]] + tables[d+1:])
+            for d in range(self.n_dims)
+        ], axis=-1) * np.reshape(self.amplitudes, [-1, 1, 1, 1])
+
+        # (n_simples, n_grs, n_freqs, [n_dims]) -> (n_grs, n_freqs, n_simples [* n_dims])
+        return np.concatenate([
+            np.moveaxis(amplitudes_jacobian, 0, -1),
+            np.moveaxis(parameters_jacobian, 0, -2).reshape([*amplitudes_jacobian.shape[1:], -1])
+        ], axis=2)
+
     def _evaluate(self, xs) :
-        return np.tensordot(
-            self.amplitudes,
-            np.array([simple_adf._evaluate(xs) for simple_adf in self.simple_adfs]),
-            axes = ([0], [0])
-        )
+        values = np.empty([self.n_simples, xs.shape[0]])
+        for simple_type, index in self._groups :
+            values[index] = simple_type._evaluate_parameters(
+                np.reshape(self._stacked_parameters[index], [-1, 1, self.n_dims]),
+                np.reshape(xs, [1, -1, self.n_dims])
+            )
+
+        return np.tensordot(self.amplitudes, values, axes = ([0], [0]))
 
     def _parameters_bounds(self, which="upper") :
-        bounds = []
-        for simple_adf in self.simple_adfs :
-            bounds = bounds + simple_adf.bounds[which]
+        return list(self._bounds[which])
 
-        return bounds
+    def _residuals(self, problem, ps_vector, method="recurrence") :
+        """The residuals of the compiled training `problem` at `ps_vector`."""
+        n = self.n_simples
+        self.amplitudes = np.array(ps_vector[:n])
+        self.parameters = np.array(ps_vector[n:])
+
+        # scipy keeps the residuals of the previous iterate, so they can't share the buffer of the problem
+        return problem.residuals(self, method=method).copy()
 
-    def _residuals(self, reports, ps_vector, what="reach_truncate") :
+    def _jacobian(self, problem, ps_vector) :
+        """The jacobian of `_residuals` with respect to `ps_vector`."""
         n = self.n_simples
         self.amplitudes = np.array(ps_vector[:n])
         self.parameters = np.array(ps_vector[n:])
 
-        constraints = self.normal_deviations()
-        residuals = []
-        for report in reports :
-            reaches, freqs = report.reach_freq_values(normalized=True, max_freq=report.max_freq)
-            grs            = report.gr_values
-            ## NOTE: It is assumed that the ftrunc_reach returns frequencies in the itertools.product order...
-            residuals.append(reaches - self.ftrunc_reach(grs, report.max_freq))
+        return problem.jacobian(self)
+
+    def _project_amplitudes(self, problem, parameters, method="recurrence") :
+        """Sets the `parameters` and the amplitudes that minimize the residuals of the training `problem` for them.
+
+        The residuals are linear in the amplitudes, so they are found by a bounded linear least squares (including the normalization constraints).
+
+        Returns:
+            The design matrix of the amplitudes, see `TrainingProblem.design`.
+        """
+        self.parameters = np.array(parameters)
+        design = problem.design(self, method=method)
+        self.amplitudes = lsq_linear(design, problem.weighted_targets, bounds=(1.0e-5, 1.0), method="bvls").x
+        return design
+
+    def _projected_residuals(self, problem, parameters, method="recurrence") :
+        """The residuals of the training `problem` as a function of the parameters alone, with the optimal amplitudes."""
+        design = self._project_amplitudes(problem, parameters, method=method)
+        return problem.weighted_targets - design @ self.amplitudes
+
+    def _projected_jacobian(self, problem, parameters, method="recurrence") :
+        """The jacobian of `_projected_residuals` with respect to the parameters (by the formula of Golub and Pereyra)."""
+        design    = self._project_amplitudes(problem, parameters, method=method)
+        residuals = problem.weighted_targets - design @ self.amplitudes
+        jacobian  = problem.jacobian(self)[:, self.n_simples:]
+
+        # the amplitudes at their bounds stay fixed, the free ones follow the parameters
+        free = (self.amplitudes > 1.0e-5) & (self.amplitudes < 1.0)
+        if not free.any() :
+            return jacobian
+
+        # each parameter only changes the design column of its simple ADF, by the jacobian at fixed amplitudes over its amplitude
+        q, r = np.linalg.qr(design[:, free])
+        components = np.repeat(np.arange(self.n_simples), self.n_dims)
+        columns = np.flatnonzero(free[components])
+        changes = np.zeros([free.sum(), jacobian.shape[1]])
+        changes[(np.cumsum(free) - 1)[components[columns]], columns] = (
+            (residuals @ jacobian[:, columns]) / self.amplitudes[components[columns]]
+        )
+
+        return jacobian - q @ (q.T @ jacobian) + q @ np.linalg.solve(r.T, changes)
+
+    def _fit(self, problem, method="recurrence", solver="least_squares", trust_radius=None, max_nfev=5000, **options) :
+        """Fits the mixture ADF to the compiled training `problem` from its current amplitudes and parameters, see `train`.
+
+        The `options` (e.g. `ftol` or `xtol`) are passed on to `scipy.optimize.least_squares`, or to the L-BFGS-B `scipy.optimize.minimize` for the "lbfgs" solver.
+        """
+        if solver in ("least_squares", "lbfgs") :
+            residual_fn = lambda xs : self._residuals(problem, xs, method=method)
+            jacobian_fn = lambda xs : self._jacobian(problem, xs)
+
+            x0  = [*self.amplitudes, *self.parameters]
+
+            bounds = ([1.0e-5] * self.n_simples + self._parameters_bounds(which="lower"),
+                      [1.0]    * self.n_simples + self._parameters_bounds(which="upper"))
 
-        return np.hstack([constraints, np.array(residuals).flatten()])
+        else :
+            residual_fn = lambda xs : self._projected_residuals(problem, xs, method=method)
+            jacobian_fn = lambda xs : self._projected_jacobian(problem, xs, method=method)
+
+            x0 = self.parameters
+
+            bounds = (self._parameters_bounds(which="lower"), self._parameters_bounds(which="upper"))
+
+        if trust_radius is not None :
+            # the trust region around the current fit, the parameters are positive and move by a factor, while the amplitudes
+            # move by `trust_radius` times the width of their bounds, so that an amplitude at its lower bound can come back
+            lower, upper = np.divide(x0, 1 + trust_radius), np.multiply(x0, 1 + trust_radius)
+            if solver in ("least_squares", "lbfgs") :
+                lower[:self.n_simples] = np.subtract(x0[:self.n_simples], trust_radius * (1.0 - 1.0e-5))
+                upper[:self.n_simples] = np.add(x0[:self.n_simples], trust_radius * (1.0 - 1.0e-5))
+            bounds = (np.maximum(bounds[0], lower), np.minimum(bounds[1], upper))
+
+        if solver == "lbfgs" :
+            def loss_fn(xs) :
+                self.amplitudes = np.array(xs[:self.n_simples])
+                self.parameters = np.array(xs[self.n_simples:])
+                return problem.loss_and_gradient(self, method=method)
+
+            result = minimize(loss_fn, x0=x0, jac=True, method="L-BFGS-B", bounds=list(zip(*bounds)),
+                              options={"maxfun" : max_nfev, "maxiter" : max_nfev, **options})
+            # the loss is the cost of least_squares, i.e. half the sum of the squared residuals
+            result.cost = result.fun
+        else :
+            result = least_squares(residual_fn, x0=x0, jac=jacobian_fn, bounds=bounds, max_nfev=max_nfev, **options)
+
+        xs = result.x
+        if solver in ("least_squares", "lbfgs") :
+            self.amplitudes = np.array(xs[:self.n_simples])
+            self.parameters = np.array(xs[self.n_simples:])
+        else :
+            self._project_amplitudes(problem, xs, method=method)
 
-    def train(self, *reports, what="reach_truncate") :
+        return result
+
+    def train(self, *reports, what="reach_truncate", method="recurrence", weights=None, solver="least_squares", trust_radius=None, schedule=None) :
         """trains the mixture ADF against a set of `reports`
 
         Args:
-            reports: The reports used to train the
-        """
-        old_amplitudes = self.amplitudes
-        old_parameters = self.parameters
+            reports: The reports used to train the ADF, or a single `TrainingProblem` compiled from them.
+            what (str or list of str): The targets of the fit, see `TrainingProblem`. "reach_truncate" (the default) fits the full truncated reach box, which grows exponentially with the number of dimensions, while "marginals", "overlaps" and "kplus" only grow polynomially. A compiled problem keeps its own targets.
+            method (str): The evaluation method of the reach box, see `ftrunc_reach`. Use "log" for large gross ratings and frequencies.
+            weights (list of floats): The weight of each report in the least squares (default None, all ones).
+            solver (str): "least_squares" fits the amplitudes and the parameters together, "projection" fits only the parameters and solves the amplitudes by a bounded linear least squares at every step (variable projection), which needs fewer evaluations and depends less on the starting amplitudes. "lbfgs" minimizes the sum of the squared residuals by L-BFGS-B with the gradient accumulated report by report, so its memory doesn't grow with the number of reports (see `TrainingProblem.loss_and_gradient`).
+            trust_radius (float): If given the fitted parameters can only move from the current ones by a factor of `1 + trust_radius` and the amplitudes by `trust_radius` (of their bounds width), e.g. for a warm start (default None, no limit).
+            schedule (list of dicts): The coarse-to-fine stages fitted one after the other, each starting from the solution of the previous one. A stage is the cheaper problem of `TrainingProblem.coarsen` with its "max_freq", "marginals" and "n_reports" keys, and the other keys (e.g. "ftol" or "max_nfev") are options of `scipy.optimize.least_squares` for that stage. The full problem is fitted last unless the last stage already is, e.g. `[{"marginals" : True, "max_freq" : 3}, {"max_freq" : 6, "ftol" : 1.0e-4}]`.
 
-        residual_fn = lambda xs : self._residuals(reports, xs, what=what)
+        Returns:
+            The `scipy.optimize.OptimizeResult` of the (last) fit. The jacobian of the residuals is supplied analytically.
+        """
+        if len(reports) == 1 and isinstance(reports[0], TrainingProblem) :
+            problem = reports[0]
+        else :
+            # the reports are compiled into arrays once, the residuals of every iteration are pure array math
+            problem = TrainingProblem(reports, weights=weights, what=what)
 
-        x0  = [*self.amplitudes, *self.parameters]
+        if solver not in ("least_squares", "projection", "lbfgs") :
+            raise Exception(f"Unknown solver {solver}")
 
-        bounds = ([1.0e-5] * self.n_simples + self._parameters_bounds(which="lower"),
-                  [1.0]    * self.n_simples + self._parameters_bounds(which="upper"))
+        old_amplitudes = self.amplitudes
+        old_parameters = self.parameters
 
         try:
-            result = least_squares(residual_fn, x0=x0, bounds=bounds, max_nfev=5000)
-
-            xs = result.x
-            #print("xs", xs)
+            fitted = False
+            for stage in ([] if schedule is None else schedule) :
+                options = dict(stage)
+                stage_problem = problem.coarsen(
+                    max_freq=options.pop("max_freq", None), marginals=options.pop("marginals", False), n_reports=options.pop("n_reports", None)
+                )
+                result = self._fit(stage_problem, method=method, solver=solver, trust_radius=trust_radius, **options)
+                fitted = stage_problem is problem
+
+            if not fitted :
+                result = self._fit(problem, method=method, solver=solver, trust_radius=trust_radius)
 
         except Exception as e:
             #print(e)
@@ -178,6 +576,100 @@ class MixtureADF(AbstractADF) :
             self.parameters = old_parameters
             raise Exception("Even one exp didn't fit!")
 
+        return result
+
+    def refit(self, problem, *reports, weights=None, trust_radius=0.5, what="reach_truncate", method="recurrence", solver="least_squares") :
+        """Refits the trained mixture ADF incrementally as new reports arrive.
+
+        The fit starts from the current amplitudes and parameters and stays within a trust region around them, and the compiled targets of the reports of `problem` are reused, so only the new `reports` are read.
+
+        Args:
+            problem (TrainingProblem): The problem of the previous fit, or None to compile the `reports` alone.
+            reports: The new reports.
+            weights (list of floats): The weight of each new report (default None, all ones).
+            trust_radius (float): The fitted parameters can move by at most a factor of `1 + trust_radius` and the amplitudes by at most `trust_radius`, see `train`.
+            what, method, solver: The training options, see `train`.
+
+        Returns:
+            A tuple of `(result, problem, changes)`, the `scipy.optimize.OptimizeResult` of the fit, the extended problem for the next refit and a dataframe of the relative changes of the amplitude and the parameters of each simple ADF.
+        """
+        if problem is None :
+            problem = TrainingProblem(reports, weights=weights, what=what)
+        elif len(reports) > 0 :
+            problem = problem.extend(reports, weights=weights)
+
+        old_amplitudes = self.amplitudes
+        old_parameters = self._stacked_parameters
+        result = self.train(problem, what=what, method=method, solver=solver, trust_radius=trust_radius)
+
+        changes = pd.DataFrame(
+            np.hstack([
+                (self.amplitudes / old_amplitudes - 1)[:, np.newaxis],
+                self._stacked_parameters / old_parameters - 1
+            ]),
+            columns=['Amplitude', *[f'dim={d}' for d in range(self.n_dims)]]
+        )
+        return result, problem, changes
+
+    def train_multistart(self, *reports, n_starts=8, seed=None, tol=None, n_workers=None,
+                         what="reach_truncate", method="recurrence", weights=None, solver="least_squares") :
+        """Trains the mixture ADF from `n_starts` randomized parameters on a process pool and keeps the best fit.
+
+        Args:
+            reports: The reports used to train the ADF, or a single `TrainingProblem` compiled from them.
+            n_starts (int): The number of randomized starts.
+            seed (int): The seed of the `numpy.random.SeedSequence` spawning the seed of each start.
+            tol (float): If given the remaining starts are cancelled once a fit has a cost (half the sum of the squared residuals) below it, the worker processes of the starts that are still running are terminated.
+            n_workers (int): The number of processes (default None, the number of CPUs), 1 runs the starts one by one in this process.
+            what, method, weights, solver: The training options, see `train`.
+
+        Returns:
+            A tuple of `(adf, summary)`, a trained copy of the ADF with the lowest cost and a dataframe of the cost, nfev, wall time and status of every start. The ADF itself is not modified.
+        """
+        if len(reports) == 1 and isinstance(reports[0], TrainingProblem) :
+            problem = reports[0]
+        else :
+            problem = TrainingProblem(reports, weights=weights, what=what)
+
+        options = {"what" : what, "method" : method, "solver" : solver}
+        seeds   = np.random.SeedSequence(seed).spawn(n_starts)
+        fits    = [None] * n_starts
+
+        if n_workers == 1 :
+            for i, start_seed in enumerate(seeds) :
+                fits[i] = _fit_start(copy.deepcopy(self), problem, start_seed, options)
+                if tol is not None and fits[i][2] <= tol :
+                    break
+        else :
+            pool = multiprocessing.Pool(n_workers)
+            try :
+                tasks = [(i, self, problem, start_seed, options) for i, start_seed in enumerate(seeds)]
+                for i, fit in pool.imap_unordered(_fit_start_task, tasks) :
+                    fits[i] = fit
+                    if tol is not None and fit[2] <= tol :
+                        break
+            finally :
+                # the pool is terminated rather than closed, so the starts that are still running are stopped as well
+                pool.terminate()
+                pool.join()
+
+        summary = pd.DataFrame(
+            [
+                [i, np.nan, np.nan, np.nan, "cancelled"] if fit is None else [i, fit[2], fit[3], fit[5], fit[4]]
+                for i, fit in enumerate(fits)
+            ],
+            columns=["start", "cost", "nfev", "time", "status"]
+        )
+
+        costs = summary["cost"].fillna(np.inf).values
+        if not np.isfinite(costs).any() :
+            raise Exception("None of the starts fit!")
+
+        best = copy.deepcopy(self)
+        best.amplitudes = fits[np.argmin(costs)][0]
+        best.parameters = fits[np.argmin(costs)][1]
+        return best, summary
+
     def marginal(self, dims):
         """The marginal distribution of the ADF.
 
@@ -188,19 +680,23 @@ class MixtureADF(AbstractADF) :
             The marginal ADF of the same kind.
         """
 
-        return type(self)(
+        marginal = type(self)(
             self.amplitudes,
             [simple_adf.marginal(dims=dims) for simple_adf in self.simple_adfs]
         )
+        marginal._dtype = self._dtype
+        return marginal
 
     def conditional(self, dims, values) :
         dims_unconditioned = [d for d in range(self.n_dims) if d not in dims]
         amplitude_factors = np.array([simple_adf.marginal(dims).evaluate(values) for simple_adf in self.simple_adfs]).flatten()
         factor = np.sum(amplitude_factors)
-        return type(self)(
+        conditional = type(self)(
             self.amplitudes * amplitude_factors/factor,
             [simple_adf.marginal(dims=dims_unconditioned) for simple_adf in self.simple_adfs]
         )
+        conditional._dtype = self._dtype
+        return conditional
 
     def cdf(self, X) :
         """The cumulative distribution function (only for 1D ADFs)
@@ -238,7 +734,7 @@ class MixtureADF(AbstractADF) :
         if self.n_dims == 1 :
             res[0] = self.inverse_cdf(rs[0])
         else :
-            res[0] = self.marginal(dims=[0]).sample(rs[0])
+            res[:1] = self.marginal(dims=[0]).sample(rs[0])
             res[1:] = self.conditional(dims=[0], values=rs[0]).sample(rs[1:])
 
         return res
@@ -267,7 +763,7 @@ class MixtureADF(AbstractADF) :
         activities = np.array([
             self.sample(uniform_samples[i, :])
             for i in range(population_size)
-        ])
+        ], dtype=self.dtype)
 
         ## TODO: Document the normalization of activities in more detail
         #normalizing activities
@@ -306,7 +802,7 @@ class MixtureADF(AbstractADF) :
         if d is None:
             return [self.extents(dim) for dim in range(self.n_dims)]
         else :
-            return np.sum(self.amplitudes * self.parameters[d::self.n_dims])
+            return np.sum(self.amplitudes * self._stacked_parameters[:, d])
 
     def normalization_info(self) :
         return pd.DataFrame(
@@ -463,7 +959,7 @@ class MixtureOfDeltas(MixtureADF) :
         activities = np.array([
             self.sample(uniform_samples[i, :])
             for i in range(population_size)
-        ])
+        ], dtype=self.dtype)
 
         ## TODO: Document the normalization of activities in more detail
         #normalizing activities
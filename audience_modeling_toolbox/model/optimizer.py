@@ -0,0 +1,249 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import pandas as pd
+
+class MediaMixOptimizer :
+    """Batched gradient-based media mix optimizer for a trained ADF.
+
+    The optimizer maximizes the effective reach, i.e. the reach of a total frequency between `k` and `max_freq` summed over the media, under a total budget using the analytic gradients of the reach with respect to the gross rating of every medium. Many scenarios (budgets) are solved together by projected gradient ascent.
+    """
+
+    def __init__(self, adf, cpms, population_size, media_cols=None) :
+        """
+        Args:
+            adf (AbstractADF) : The trained ADF, e.g. a `MixtureADF`.
+            cpms (list of floats) : The cost per thousand impressions of each medium.
+            population_size (int) : The size of the population, used to turn the gross ratings into impressions.
+            media_cols (list of string) : The labels of the media (default `dim=d`).
+        """
+        if len(cpms) != adf.n_dims :
+            raise Exception(f"The number of cpms {cpms} doesn't match the dimension {adf.n_dims}.")
+
+        self.adf             = adf
+        self.n_dims          = adf.n_dims
+        self.cpms            = np.asarray(cpms, dtype=float)
+        self.population_size = population_size
+        self.media_cols      = media_cols if media_cols is not None else [f'dim={d}' for d in range(self.n_dims)]
+
+    @property
+    def costs(self) :
+        """The cost of one gross rating point on each medium."""
+        return self.cpms * self.population_size / 1000
+
+    def cost(self, grs) :
+        """The cost of the media plans `grs` of shape (n_plans, n_dims)."""
+        return np.reshape(grs, [-1, self.n_dims]) @ self.costs
+
+    def effective_reach(self, grs, k=1, max_freq=None) :
+        """The reach of a total frequency between `k` and `max_freq` (inclusive, no upper limit if None) for the media plans `grs`."""
+        reach = self.adf.kplus_reach(grs, k)
+        if max_freq is not None :
+            reach = reach - self.adf.kplus_reach(grs, max_freq + 1)
+        return reach
+
+    def effective_reach_gradient(self, grs, k=1, max_freq=None) :
+        """The gradient of `effective_reach` with respect to the gross ratings of each medium."""
+        gradient = self.adf.kplus_reach_gradient(grs, k)
+        if max_freq is not None :
+            gradient = gradient - self.adf.kplus_reach_gradient(grs, max_freq + 1)
+        return gradient
+
+    def frequency_cap_grs(self, max_average_freq, tol=1.0e-10) :
+        """The largest gross rating of each medium with an average frequency (gross rating over 1+ reach on that medium) not exceeding `max_average_freq`.
+
+        The average frequency grows with the gross rating, so a frequency cap is an upper bound on the gross ratings.
+
+        Args:
+            max_average_freq (float or list of floats) : The frequency cap of each medium.
+
+        Returns:
+            The upper bound of the gross ratings of each medium.
+        """
+        caps = np.broadcast_to(np.asarray(max_average_freq, dtype=float), [self.n_dims])
+
+        def average_freq(grs) :
+            reaches = self.adf.kplus_reach(np.diag(grs), 1, subsets=[[d] for d in range(self.n_dims)])
+            return grs / np.diag(reaches)
+
+        lower, upper = np.zeros(self.n_dims), np.ones(self.n_dims)
+        for i in range(64) :
+            exceeded = average_freq(upper) > caps
+            if exceeded.all() :
+                break
+            lower, upper = np.where(exceeded, lower, upper), np.where(exceeded, upper, 2 * upper)
+
+        while np.any(upper - lower > tol * upper) :
+            middle = (lower + upper) / 2
+            exceeded = average_freq(middle) > caps
+            lower, upper = np.where(exceeded, lower, middle), np.where(exceeded, middle, upper)
+
+        return np.where(np.isfinite(caps), lower, np.inf)
+
+    @staticmethod
+    def _project(spends, budgets, lower, upper) :
+        """Projects the spends of the plans onto the box [lower, upper] under the total budgets."""
+        projected = np.clip(spends, lower, upper)
+        over = projected.sum(axis=1) > budgets
+        if not over.any() :
+            return projected
+
+        # find the multiplier of the budget constraint by bisection, simultaneously for all the scenarios
+        y = spends[over]
+        lambda_lower = np.zeros(len(y))
+        lambda_upper = np.max(y - lower[over], axis=1)
+        for i in range(100) :
+            middle = (lambda_lower + lambda_upper) / 2
+            spent  = np.clip(y - middle[:, np.newaxis], lower[over], upper[over]).sum(axis=1)
+            lambda_lower = np.where(spent > budgets[over], middle, lambda_lower)
+            lambda_upper = np.where(spent > budgets[over], lambda_upper, middle)
+
+        projected[over] = np.clip(y - lambda_upper[:, np.newaxis], lower[over], upper[over])
+        return projected
+
+    def _solve(self, budgets, lower, upper, objective, gradient, max_iter, tol) :
+        """Maximizes the `objective` of the spends of each medium under the `budgets` within [lower, upper] by spectral projected gradient ascent.
+
+        Returns:
+            The tuple of the optimal `(spends, values)` of each scenario.
+        """
+        n_budgets = len(budgets)
+
+        # start by spending the budget equally on all the media
+        spends = self._project(np.outer(budgets, np.ones(self.n_dims) / self.n_dims), budgets, lower, upper)
+        values = objective(spends)
+        grads  = gradient(spends)
+        steps  = budgets / np.maximum(np.linalg.norm(grads, axis=1), 1.0e-300)
+
+        # all the scenarios that haven't converged are updated together
+        active = np.arange(n_budgets)
+        for i in range(max_iter) :
+            x, g = spends[active], grads[active]
+            scales = budgets[active] / np.maximum(np.linalg.norm(g, axis=1), 1.0e-300)
+
+            # stop where the projected gradient step scaled by the squared budget doesn't move the plan,
+            # i.e. where spending the whole budget along the feasible direction changes the reach by less than `tol`
+            stationary = self._project(x + budgets[active, np.newaxis]**2 * g, budgets[active], lower[active], upper[active])
+            converged  = np.linalg.norm(stationary - x, axis=1) <= tol * budgets[active]
+            active, x, g, scales = active[~converged], x[~converged], g[~converged], scales[~converged]
+            if len(active) == 0 :
+                break
+
+            directions = self._project(x + steps[active, np.newaxis] * g, budgets[active], lower[active], upper[active]) - x
+            slopes     = np.sum(g * directions, axis=1)
+
+            # backtracking line search along the projected directions with the Armijo condition
+            fractions  = np.ones(len(active))
+            candidates = x + directions
+            candidate_values = objective(candidates)
+            failed = candidate_values < values[active] + 1.0e-4 * fractions * slopes
+            for j in range(40) :
+                if not failed.any() :
+                    break
+                fractions[failed] /= 2
+                candidates[failed] = x[failed] + fractions[failed, np.newaxis] * directions[failed]
+                candidate_values[failed] = objective(candidates[failed])
+                failed = candidate_values < values[active] + 1.0e-4 * fractions * slopes
+
+            # the reach can't be improved within the numerical precision where the line search fails
+            active, x, g, scales = active[~failed], x[~failed], g[~failed], scales[~failed]
+            candidates, candidate_values = candidates[~failed], candidate_values[~failed]
+            candidate_grads = gradient(candidates)
+
+            # Barzilai-Borwein step for the next iteration
+            ds = candidates - x
+            dg = g - candidate_grads
+            curvatures = np.sum(ds * dg, axis=1)
+            steps[active] = np.where(
+                curvatures > 0,
+                np.clip(np.sum(ds * ds, axis=1) / np.where(curvatures > 0, curvatures, 1.0), 1.0e-10 * scales, 1.0e10 * scales),
+                1.0e10 * scales
+            )
+
+            spends[active], values[active], grads[active] = candidates, candidate_values, candidate_grads
+
+        return spends, values
+
+    def optimize(self, budgets, k=1, max_freq=None, min_grs=None, max_grs=None, max_average_freq=None,
+                 max_iter=1000, tol=1.0e-9, n_curve=11) :
+        """Finds the media plans that maximize the effective reach for a batch of budgets.
+
+        Args:
+            budgets (numpy vector) : The total budget of each scenario.
+            k (int) : The minimum total frequency of the effective reach (default 1, i.e. the 1+ reach).
+            max_freq (int) : The maximum total frequency of the effective reach (default None, no maximum).
+            min_grs (numpy ndarray) : The minimum gross rating of each medium, of shape (n_dims,) or (n_scenarios, n_dims).
+            max_grs (numpy ndarray) : The maximum gross rating of each medium, of shape (n_dims,) or (n_scenarios, n_dims).
+            max_average_freq (float or list of floats) : The cap of the average frequency of each medium.
+            max_iter (int) : The maximum number of iterations.
+            tol (float) : The tolerance of the change of the effective reach along the projected gradient.
+            n_curve (int) : The number of evenly spaced fractions of the budget of the reach curves, from zero to the full budget.
+
+        Returns:
+            A tuple of `(plans, curves)`. The `plans` dataframe has the budget, the optimal gross ratings of each medium, the cost, and the effective reach of each scenario. The `curves` dataframe has the optimal effective reach of each scenario at every fraction of its budget (under the same constraints, nan where the fraction can't pay for `min_grs`), with the fractions as columns.
+        """
+        budgets   = np.atleast_1d(np.asarray(budgets, dtype=float))
+        n_budgets = len(budgets)
+
+        lower = np.broadcast_to(0.0 if min_grs is None else np.asarray(min_grs, dtype=float), [n_budgets, self.n_dims])
+        upper = np.broadcast_to(np.inf if max_grs is None else np.asarray(max_grs, dtype=float), [n_budgets, self.n_dims])
+        if max_average_freq is not None :
+            upper = np.minimum(upper, self.frequency_cap_grs(max_average_freq))
+        if np.any(lower > upper) or np.any(lower @ self.costs > budgets) :
+            raise Exception("The constraints of one or more scenarios are not feasible.")
+
+        # the plans are optimized in terms of the spend of each medium, where the budget constraint is a plain sum
+        costs     = self.costs
+        lower     = lower * costs
+        upper     = upper * costs
+        objective = lambda spends : self.effective_reach(spends / costs, k=k, max_freq=max_freq)
+        gradient  = lambda spends : self.effective_reach_gradient(spends / costs, k=k, max_freq=max_freq) / costs
+
+        # the curves are the optimal effective reach of every fraction of the budget, solved as extra scenarios of the same batch,
+        # they are nan where the fraction of the budget can't pay for the minimum gross ratings
+        fractions     = np.linspace(0, 1, n_curve)
+        curve_budgets = np.outer(budgets, fractions).ravel()
+        curve_lower   = np.repeat(lower, n_curve, axis=0)
+        curve_upper   = np.repeat(upper, n_curve, axis=0)
+        feasible      = curve_lower.sum(axis=1) <= curve_budgets * (1 + 1.0e-12)
+
+        spends, values = self._solve(
+            np.concatenate([budgets, curve_budgets[feasible]]),
+            np.concatenate([lower, curve_lower[feasible]]),
+            np.concatenate([upper, curve_upper[feasible]]),
+            objective, gradient, max_iter, tol
+        )
+        curves = np.full(len(curve_budgets), np.nan)
+        curves[feasible] = values[n_budgets:]
+        curves = curves.reshape([n_budgets, n_curve])
+        spends, values = spends[:n_budgets], values[:n_budgets]
+
+        grs = spends / costs
+
+        plans = pd.concat([
+            pd.DataFrame(budgets, columns=['budget']),
+            pd.DataFrame(grs, columns=self.media_cols),
+            pd.DataFrame({'cost' : self.cost(grs), 'reach' : values})
+        ], axis=1)
+
+        return plans, pd.DataFrame(curves, columns=fractions)
@@ -0,0 +1,183 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+
+from audience_modeling_toolbox.helpers import _max_freqs
+from audience_modeling_toolbox.model.models import _outer_box, _split_tables
+
+def _simple_components(adf) :
+    """The amplitudes, the `(simple ADF type, indices)` groups and the stacked parameters of the simple ADFs of an ADF, a simple ADF being a mixture of itself."""
+    if hasattr(adf, "_groups") :
+        return adf.amplitudes, adf._groups, adf._stacked_parameters
+    return np.ones(1), [(type(adf), np.array([0]))], np.reshape(adf.parameters, [1, -1])
+
+class ReachSurfaceIndex :
+    """A precomputed lattice of the truncated reach box of an ADF for fast lookups.
+
+    The `ftrunc_reach` of the ADF is evaluated once on the lattice of the gross ratings `gr_axes` and the queries are answered by multilinear interpolation of the lattice. Every cell of the lattice carries a bound of the interpolation error derived from the rate kernels of the simple ADFs (see `_cell_bounds`), and the queries outside the lattice or with an error bound above a tolerance are evaluated exactly by the ADF.
+
+    The index is a snapshot of the ADF, it has to be rebuilt when the parameters of the ADF change.
+    """
+
+    def __init__(self, adf, gr_axes, max_freq, dtype=np.float64, block_size=2**12) :
+        """
+        Args:
+            adf (AbstractADF) : The trained ADF, a simple ADF or a `MixtureADF` of simple ADFs.
+            gr_axes (list of numpy vectors) : The increasing gross ratings of the lattice along each dimension, at least two of them.
+            max_freq (int) : The maximum frequency of the reach box.
+            dtype (numpy dtype) : The floating point type the lattice is stored in, e.g. `np.float32` for half the memory (its rounding is added to the error bounds).
+            block_size (int) : The number of lattice points (or cells) evaluated together.
+        """
+        if len(gr_axes) != adf.n_dims :
+            raise Exception(f"The number of lattice axes {len(gr_axes)} doesn't match the dimension {adf.n_dims}.")
+
+        self.adf      = adf
+        self.n_dims   = adf.n_dims
+        self.max_freq = max_freq
+        self.gr_axes  = [np.asarray(axis, dtype=float) for axis in gr_axes]
+        for axis in self.gr_axes :
+            if len(axis) < 2 or axis[0] < 0 or np.any(np.diff(axis) <= 0) :
+                raise Exception("The lattice axes have to be increasing non-negative gross ratings, at least two of them.")
+
+        self.shape = tuple(len(axis) for axis in self.gr_axes)
+        self._strides = np.ravel_multi_index(tuple(np.eye(self.n_dims, dtype=int)), self.shape)
+        nodes = np.stack(np.meshgrid(*self.gr_axes, indexing='ij'), axis=-1).reshape([-1, self.n_dims])
+        self.values = self._evaluate(nodes, block_size).reshape(self.shape + (-1,)).astype(dtype)
+
+        # the rounding of the lattice values: of the stored dtype, and of the evaluation by the ADF where the reach_plus is one minus a sum of max_freq pmfs
+        rounding = np.finfo(dtype).eps + (_max_freqs(max_freq, self.n_dims).max() + 2) * np.finfo(adf.dtype).eps
+        self.bounds = self._cell_bounds(block_size) + rounding
+
+    def _evaluate(self, grs, block_size) :
+        """The exact truncated reach box of the ADF evaluated in blocks of gross ratings."""
+        return np.concatenate([
+            self.adf.ftrunc_reach(grs[start:start+block_size], self.max_freq)
+            for start in range(0, len(grs), block_size)
+        ])
+
+    def _cell_bounds(self, block_size) :
+        """The bound of the error of the multilinear interpolation on every cell of the lattice.
+
+        The multilinear interpolation error of a function on a cell is bounded by `sum_d h_d^2 / 8 * max |d^2 f / d gr_d^2|` over the cell. Every entry of the truncated reach box is `sum_i a_i prod_d phi_id(theta_id gr_d)`, where `phi_id` is the pmf or the reach_plus rate kernel of the simple ADF `i`, so that over the cell
+
+            |d^2 f / d gr_d^2| <= sum_i |a_i| theta_id^2 max |phi_id''| prod_{e != d} max phi_ie
+
+        with the maxima over the rates of the cell. They are bounded analytically by the `_f_reach_rates_peak` and the `*_curvature` kernels of the simple ADF types, the bound holds for all the gross ratings of the cell.
+        """
+        amplitudes, groups, parameters = _simple_components(self.adf)
+        amplitudes = np.abs(amplitudes)
+        max_freqs  = _max_freqs(self.max_freq, self.n_dims)
+        freqs = np.reshape(np.arange(max_freqs.max()+1), [1, 1, -1, 1])
+        tails = np.reshape(freqs == max_freqs, [1, 1, -1, self.n_dims])
+
+        cells  = np.stack(np.meshgrid(*[np.arange(len(axis) - 1) for axis in self.gr_axes], indexing='ij'), axis=-1).reshape([-1, self.n_dims])
+        bounds = np.empty(len(cells))
+        for start in range(0, len(cells), block_size) :
+            block = cells[start:start+block_size]
+            lower = np.stack([axis[block[:, d]] for d, axis in enumerate(self.gr_axes)], axis=-1)
+            upper = np.stack([axis[block[:, d] + 1] for d, axis in enumerate(self.gr_axes)], axis=-1)
+
+            peaks      = np.empty([len(parameters), len(block), freqs.size, self.n_dims])
+            curvatures = np.empty_like(peaks)
+            for simple_type, index in groups :
+                thetas = np.reshape(parameters[index], [-1, 1, 1, self.n_dims])
+                xs_lower, xs_upper = thetas * lower[:, np.newaxis, :], thetas * upper[:, np.newaxis, :]
+                # the reach_plus increases with the rate, its maximum is at the upper rate of the cell
+                peaks[index] = np.where(
+                    tails,
+                    simple_type._fplus_reach_rates(xs_upper, max_freqs),
+                    simple_type._f_reach_rates_peak(xs_lower, xs_upper, freqs)
+                )
+                curvatures[index] = thetas**2 * np.where(
+                    tails,
+                    simple_type._fplus_reach_rates_curvature(xs_lower, xs_upper, max_freqs),
+                    simple_type._f_reach_rates_curvature(xs_lower, xs_upper, freqs)
+                )
+
+            peaks, curvatures = _split_tables(peaks, max_freqs), _split_tables(curvatures, max_freqs)
+            bounds[start:start+block_size] = sum(
+                (upper[:, d] - lower[:, d])**2 / 8 * _outer_box(peaks[:d] + [curvatures[d]] + peaks[d+1:], amplitudes).max(axis=-1)
+                for d in range(self.n_dims)
+            )
+
+        return bounds.reshape([len(axis) - 1 for axis in self.gr_axes])
+
+    def _locate(self, grs) :
+        """The lower corner of the lattice cell of each query, the position within the cell and whether the query is inside the lattice."""
+        inside  = np.ones(len(grs), dtype=bool)
+        indices = np.zeros(grs.shape, dtype=int)
+        weights = np.zeros(grs.shape)
+        for d, axis in enumerate(self.gr_axes) :
+            inside &= (grs[:, d] >= axis[0]) & (grs[:, d] <= axis[-1])
+            indices[:, d] = np.clip(np.searchsorted(axis, grs[:, d], side='right') - 1, 0, len(axis) - 2)
+            weights[:, d] = (grs[:, d] - axis[indices[:, d]]) / (axis[indices[:, d] + 1] - axis[indices[:, d]])
+
+        return indices, weights, inside
+
+    def _interpolate(self, indices, weights) :
+        """The multilinear interpolation of the lattice on the located queries."""
+        values  = self.values.reshape([-1, self.values.shape[-1]])
+        base    = indices @ self._strides
+        reaches = np.zeros([len(indices), values.shape[-1]])
+        for corner in np.ndindex(*[2] * self.n_dims) :
+            corner = np.array(corner)
+            w = np.prod(np.where(corner, weights, 1 - weights), axis=1)
+            reaches += w[:, np.newaxis] * values[base + corner @ self._strides]
+
+        return reaches
+
+    def error_bound(self, grs) :
+        """The error bound of the interpolated reach box of the gross ratings `grs`, infinite outside of the lattice."""
+        grs = np.reshape(grs, [-1, self.n_dims])
+        indices, weights, inside = self._locate(grs)
+        return np.where(inside, self.bounds[tuple(indices.T)], np.inf)
+
+    def interpolate(self, grs) :
+        """The multilinear interpolation of the reach box of the gross ratings `grs` from the lattice (extrapolated outside of it)."""
+        grs = np.reshape(grs, [-1, self.n_dims])
+        indices, weights, inside = self._locate(grs)
+        return self._interpolate(indices, weights)
+
+    def ftrunc_reach(self, grs, tol=None) :
+        """Calculates the truncated reach box of the ADF from the lattice. See `AbstractADF.ftrunc_reach`.
+
+        Args:
+            grs (numpy ndarray): The gross ratings
+            tol (float): The largest acceptable error bound of the interpolation, the queries above it are evaluated exactly (default None, only the queries outside the lattice are).
+
+        Returns:
+            The reach for the box of [0, max_freq] of shape (n_grs, (max_freq+1)**n_dims).
+        """
+        grs = np.reshape(grs, [-1, self.n_dims])
+        indices, weights, inside = self._locate(grs)
+        exact = ~inside
+        if tol is not None :
+            exact |= self.bounds[tuple(indices.T)] > tol
+
+        if not exact.any() :
+            return self._interpolate(indices, weights)
+
+        reaches = np.empty([len(grs), self.values.shape[-1]])
+        reaches[~exact] = self._interpolate(indices[~exact], weights[~exact])
+        reaches[exact]  = self.adf.ftrunc_reach(grs[exact], self.max_freq)
+        return reaches
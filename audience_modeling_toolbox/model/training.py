@@ -0,0 +1,318 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+
+import copy
+import time
+
+from audience_modeling_toolbox.helpers import truncate_box, _max_freqs
+
+def _report_box(report, dims) :
+    """The normalized truncated reach box of the dimensions `dims` of a report, marginalizing the other dimensions, in the `itertools.product` order."""
+    shape = report.max_freqs[dims] + 1
+    cells = np.ravel_multi_index(report.rfdata[[report.dim_cols[d] for d in dims]].values.T.astype(int), shape)
+    return np.bincount(cells, weights=report.rfdata[report.reach_col].values, minlength=np.prod(shape)) / report.population_size
+
+def _report_total(report, max_freq) :
+    """The normalized truncated reach of the total frequency summed over the dimensions of a report.
+
+    The frequencies of the report are capped at the max_freq of their dimension, their sum is still exact up to the smallest max_freq.
+    """
+    totals = np.minimum(report.rfdata[report.dim_cols].values.sum(axis=1), max_freq).astype(int)
+    return np.bincount(totals, weights=report.rfdata[report.reach_col].values, minlength=max_freq + 1) / report.population_size
+
+class TrainingProblem :
+    """The reports of a fit compiled into arrays.
+
+    The reports are read once: the targets (the normalized reach boxes) are concatenated into one contiguous vector and the gross ratings of the reports with the same box (max_freq) are stacked into a matrix, so that each box size is evaluated by one `ftrunc_reach` call per iteration. The residuals are written into a preallocated buffer, without any pandas access.
+
+    The targets of a report are its full truncated reach box by default. As the full box grows exponentially with the number of dimensions, the objective can instead be made of the boxes of its one dimensional marginals, of its pairwise overlaps (boxes with a max_freq of zero on all but one or two dimensions) and of the reach of its total frequency. All of these are evaluated by the ADF in factorized form, at a cost polynomial in the number of dimensions.
+
+    The residual vector starts with the `1 + n_dims` normalization constraints of the mixture (see `MixtureADF.normal_deviations`, with the opposite sign), followed by the weighted differences of the targets and the boxes of the ADF. All the residuals are linear in the amplitudes of the mixture, i.e. `targets - design @ amplitudes` (see `design`).
+    """
+
+    def __init__(self, reports, weights=None, what="reach_truncate") :
+        """
+        Args:
+            reports (list of RFReport) : The reports of the fit.
+            weights (list of floats) : The weight of the squared residuals of each report (default None, all ones).
+            what (str or list of str) : The targets of each report, any of "reach_truncate" (the full truncated reach box), "marginals" (the box of each dimension), "overlaps" (the box of each pair of dimensions) and "kplus" (the reach of the total frequency up to the smallest max_freq).
+        """
+        if len(reports) == 0 :
+            raise Exception("At least one report is needed for training.")
+
+        self.what = [what] if isinstance(what, str) else list(what)
+        if len(self.what) == 0 or any(objective not in ("reach_truncate", "marginals", "overlaps", "kplus") for objective in self.what) :
+            raise Exception(f"Unknown training objective {what}")
+
+        self.n_dims        = reports[0].n_dims
+        self.n_constraints = 1 + self.n_dims
+        self._entries      = []
+        self._compile(reports, weights)
+        self._assemble()
+
+    @property
+    def n_reports(self) :
+        """The number of compiled reports, each can have several entries of targets (e.g. its marginals)."""
+        return len({entry[5] for entry in self._entries})
+
+    def _compile(self, reports, weights) :
+        """Reads the max_freq, the gross ratings, the targets and the weight of each of the `reports`."""
+        if any(report.n_dims != self.n_dims for report in reports) :
+            raise Exception("The dimensions of the reports don't match.")
+
+        weights = np.ones(len(reports)) if weights is None else np.asarray(weights, dtype=float)
+        if weights.shape != (len(reports),) or np.any(weights < 0) :
+            raise Exception(f"Invalid weights {weights} for {len(reports)} reports.")
+
+        # every entry records the index of its report, the reports added by `extend` follow the compiled ones
+        first = 1 + max((entry[5] for entry in self._entries), default=-1)
+        for index, (report, weight) in enumerate(zip(reports, weights), start=first) :
+            grs = np.reshape(report.gr_values, [-1, self.n_dims])
+            for objective in self.what :
+                if objective == "reach_truncate" :
+                    ## NOTE: It is assumed that the ftrunc_reach returns frequencies in the itertools.product order...
+                    reach = report.reach_freq_values(normalized=True, max_freq=report.max_freq)[0]
+                    self._entries.append(("box", report.max_freqs, grs, np.asarray(reach, dtype=float), np.sqrt(weight), index))
+
+                elif objective == "kplus" :
+                    max_freq = int(report.max_freqs.min())
+                    self._entries.append(("total", np.array([max_freq]), grs, _report_total(report, max_freq), np.sqrt(weight), index))
+
+                else :
+                    subsets = [[d] for d in range(self.n_dims)] if objective == "marginals" else \
+                              [[d, e] for d in range(self.n_dims) for e in range(d + 1, self.n_dims)]
+                    for dims in subsets :
+                        max_freqs = np.where(np.isin(np.arange(self.n_dims), dims), report.max_freqs, 0)
+                        self._entries.append(("box", max_freqs, grs, _report_box(report, dims), np.sqrt(weight), index))
+
+    def _assemble(self) :
+        """Concatenates the compiled reports into the contiguous targets, the stacked gross ratings of the reports with the same box and the residual buffer."""
+        groups = {}
+        for entry in self._entries :
+            groups.setdefault((entry[0], tuple(entry[1])), []).append(entry)
+
+        self.blocks = []
+        targets, scales = [np.ones(self.n_constraints)], [np.ones(self.n_constraints)]
+        start = self.n_constraints
+        for (kind, max_freqs), entries in groups.items() :
+            stop = start + sum(len(entry[3]) for entry in entries)
+            self.blocks.append((kind, [int(max_freq) for max_freq in max_freqs], np.vstack([entry[2] for entry in entries]), start, stop))
+            targets.extend(entry[3] for entry in entries)
+            scales.extend(np.full(len(entry[3]), entry[4]) for entry in entries)
+            start = stop
+
+        self.size    = start
+        self.targets = np.concatenate(targets)
+        self.scales  = np.concatenate(scales)
+        if np.all(self.scales == 1) :
+            self.scales = None
+        self.weighted_targets = self.targets if self.scales is None else self.targets * self.scales
+        self._residuals = np.empty(self.size)
+
+    def _with_entries(self, entries) :
+        """A copy of the problem with the compiled `entries`."""
+        problem = copy.copy(self)
+        problem._entries = entries
+        problem._assemble()
+        return problem
+
+    def extend(self, reports, weights=None) :
+        """A new training problem with the `reports` added, reusing the compiled targets of the reports of this problem.
+
+        Args:
+            reports (list of RFReport) : The new reports.
+            weights (list of floats) : The weight of each new report (default None, all ones).
+
+        Returns:
+            The extended `TrainingProblem`, this one is not modified.
+        """
+        problem = copy.copy(self)
+        problem._entries = list(self._entries)
+        problem._compile(reports, weights)
+        problem._assemble()
+        return problem
+
+    def coarsen(self, max_freq=None, marginals=False, n_reports=None) :
+        """A cheaper training problem from the compiled targets, e.g. for the first stages of a fit.
+
+        Args:
+            max_freq (int or list of ints) : The boxes are aggregated to at most this max_freq (of each dimension), see `truncate_box`.
+            marginals (bool) : If True each report is replaced by the boxes of its one dimensional marginals, i.e. its box aggregated to a max_freq of zero on all the other dimensions.
+            n_reports (int) : If given only this many reports, evenly spaced in their order, are kept with all their entries.
+
+        Returns:
+            The coarser `TrainingProblem`, or this one if nothing changes.
+        """
+        entries = self._entries
+        reports = list(dict.fromkeys(entry[5] for entry in entries))
+        if n_reports is not None and n_reports < len(reports) :
+            kept = {reports[i] for i in np.linspace(0, len(reports) - 1, n_reports).round().astype(int)}
+            entries = [entry for entry in entries if entry[5] in kept]
+
+        coarse = []
+        for kind, max_freqs, grs, target, scale, report in entries :
+            if kind == "total" :
+                # the reach of the total frequency is truncated like a one dimensional box and has no marginals
+                new_max_freqs = max_freqs if max_freq is None else np.minimum(max_freqs, np.min(max_freq))
+                coarse.append((kind, new_max_freqs, grs, truncate_box(target, 1, max_freqs, new_max_freqs)[0], scale, report))
+                continue
+
+            new_max_freqs = max_freqs if max_freq is None else np.minimum(max_freqs, _max_freqs(max_freq, self.n_dims))
+            if marginals :
+                for d in np.flatnonzero(max_freqs) :
+                    marginal_max_freqs = np.where(np.arange(self.n_dims) == d, new_max_freqs, 0)
+                    coarse.append((kind, marginal_max_freqs, grs, truncate_box(target, self.n_dims, max_freqs, marginal_max_freqs)[0], scale, report))
+            else :
+                coarse.append((kind, new_max_freqs, grs, truncate_box(target, self.n_dims, max_freqs, new_max_freqs)[0], scale, report))
+
+        if not marginals and len(coarse) == len(self._entries) and all(
+            np.array_equal(entry[1], old[1]) for entry, old in zip(coarse, self._entries)
+        ) :
+            return self
+        return self._with_entries(coarse)
+
+    @staticmethod
+    def _reaches(adf, kind, max_freq, grs, method="recurrence") :
+        """The reaches of the ADF for the targets of a block, of shape (n_grs, n_cells)."""
+        if kind == "box" :
+            return adf.ftrunc_reach(grs, max_freq, method=method)
+        return adf.combined_ftrunc_reach(grs, max_freq[0], method=method)
+
+    @staticmethod
+    def _reaches_jacobian(adf, kind, max_freq, grs) :
+        """The derivatives of `_reaches` with respect to `[*amplitudes, *parameters]`, of shape (n_grs, n_cells, n_simples + n_parameters)."""
+        if kind == "box" :
+            return adf.ftrunc_reach_jacobian(grs, max_freq)
+        return adf.combined_ftrunc_reach_jacobian(grs, max_freq[0])
+
+    def _constraints_jacobian(self, adf) :
+        """The jacobian of the normalization constraint residuals, the extents are sum_i amplitude_i * parameter_(i, d)."""
+        n = adf.n_simples
+        parameters = np.reshape(adf.parameters, [n, self.n_dims])
+
+        jacobian = np.zeros([self.n_constraints, n + parameters.size])
+        jacobian[0, :n] = -1.0
+        jacobian[1:, :n] = -parameters.T
+        for d in range(self.n_dims) :
+            jacobian[1 + d, n + d::self.n_dims] = -adf.amplitudes
+        return jacobian
+
+    def residuals(self, adf, method="recurrence") :
+        """The residuals of the mixture `adf` in the preallocated buffer, which is overwritten by the next call.
+
+        Args:
+            adf (MixtureADF) : The ADF with the current amplitudes and parameters.
+            method (str) : The evaluation method of the reach boxes, see `ftrunc_reach`.
+
+        Returns:
+            The residual vector of length `size`.
+        """
+        residuals = self._residuals
+        residuals[0] = 1 - np.sum(adf.amplitudes)
+        residuals[1:self.n_constraints] = 1 - adf.amplitudes @ np.reshape(adf.parameters, [-1, self.n_dims])
+        for kind, max_freq, grs, start, stop in self.blocks :
+            np.subtract(self.targets[start:stop], self._reaches(adf, kind, max_freq, grs, method).ravel(), out=residuals[start:stop])
+
+        if self.scales is not None :
+            residuals *= self.scales
+        return residuals
+
+    def jacobian(self, adf) :
+        """The jacobian of `residuals` with respect to `[*amplitudes, *parameters]` of the mixture `adf`, of shape (size, n_simples + n_parameters)."""
+        jacobian = np.zeros([self.size, adf.n_simples + len(adf.parameters)])
+        jacobian[:self.n_constraints] = self._constraints_jacobian(adf)
+        for kind, max_freq, grs, start, stop in self.blocks :
+            jacobian[start:stop] = -self._reaches_jacobian(adf, kind, max_freq, grs).reshape([stop - start, -1])
+
+        if self.scales is not None :
+            jacobian *= self.scales[:, np.newaxis]
+        return jacobian
+
+    def loss_and_gradient(self, adf, method="recurrence", chunk_size=1) :
+        """Half the sum of the squared residuals of the mixture `adf` and its gradient, without the jacobian of all the residuals.
+
+        The gradient is accumulated over chunks of `chunk_size` reports, so the memory is bounded by the jacobian of one chunk whatever the number of reports.
+
+        Returns:
+            The tuple of `(loss, gradient)`, where the gradient is with respect to `[*amplitudes, *parameters]`.
+        """
+        residuals = np.empty(self.n_constraints)
+        residuals[0]  = 1 - np.sum(adf.amplitudes)
+        residuals[1:] = 1 - adf.amplitudes @ np.reshape(adf.parameters, [-1, self.n_dims])
+        loss     = residuals @ residuals / 2
+        gradient = residuals @ self._constraints_jacobian(adf)
+
+        for kind, max_freq, grs, start, stop in self.blocks :
+            n_cells = (stop - start) // len(grs)
+            for first in range(0, len(grs), chunk_size) :
+                chunk = slice(start + first * n_cells, start + min(first + chunk_size, len(grs)) * n_cells)
+                residuals = self.targets[chunk] - self._reaches(adf, kind, max_freq, grs[first:first+chunk_size], method).ravel()
+                weights   = residuals if self.scales is None else residuals * self.scales[chunk]**2
+                loss     += weights @ residuals / 2
+                gradient -= weights @ self._reaches_jacobian(adf, kind, max_freq, grs[first:first+chunk_size]).reshape([len(residuals), -1])
+
+        return loss, gradient
+
+    def design(self, adf, method="recurrence") :
+        """The weighted design matrix of the amplitudes of the mixture `adf` for its current parameters, i.e. the weighted residuals are `weighted_targets - design @ amplitudes`.
+
+        The columns are the normalization constraints (one and the parameters of each simple ADF) and the targets of each simple ADF.
+
+        Returns:
+            The matrix of shape (size, n_simples).
+        """
+        design = np.empty([self.size, adf.n_simples])
+        design[0] = 1.0
+        design[1:self.n_constraints] = np.reshape(adf.parameters, [-1, self.n_dims]).T
+        for kind, max_freq, grs, start, stop in self.blocks :
+            if kind == "box" :
+                reaches = adf._component_ftrunc_reach(grs, max_freq, method=method)
+            else :
+                reaches = adf._combined_components(grs, max_freq[0])
+            design[start:stop] = reaches.reshape([adf.n_simples, -1]).T
+
+        if self.scales is not None :
+            design *= self.scales[:, np.newaxis]
+        return design
+
+def _fit_start(adf, problem, seed, options) :
+    """Trains the ADF from randomized parameters, the task of a start of `MixtureADF.train_multistart`.
+
+    Returns:
+        The tuple of `(amplitudes, parameters, cost, nfev, status, time)` of the fit.
+    """
+    start = time.perf_counter()
+    adf.randomize(np.random.default_rng(seed))
+    try :
+        result = adf.train(problem, **options)
+        cost, nfev, status = result.cost, result.nfev, "converged" if result.success else "stopped"
+    except Exception :
+        cost, nfev, status = np.inf, np.nan, "failed"
+
+    return adf.amplitudes, adf.parameters, cost, nfev, status, time.perf_counter() - start
+
+def _fit_start_task(task) :
+    """The `(index, fit)` of the start `task = (index, adf, problem, seed, options)` on the process pool of `MixtureADF.train_multistart`, see `_fit_start`."""
+    index, adf, problem, seed, options = task
+    return index, _fit_start(adf, problem, seed, options)
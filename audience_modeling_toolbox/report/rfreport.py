@@ -29,6 +29,7 @@ import itertools
 import warnings
 
 from audience_modeling_toolbox.plotting import _plot_1d_reach, _plot_2d_reach
+from audience_modeling_toolbox.helpers import _max_freqs
 
 class AbstractRFReport(ABC) :
     """Abstract class for reach and frequency (RF) reports
@@ -49,7 +50,7 @@ class RFReport(AbstractRFReport) :
 
         Args:
             dataframe (int): The reach and frequency Pandas dataframe. It is assumed to have complete information on the reach and frequency, that means  all the observed frequencies for each dimensions is present in the table, i.e. it is not trimmed.
-            max_freq (int): The max_freq allowed in the dataframe, all higher frequencies will be
+            max_freq (int or list of ints): The max_freq allowed in the dataframe, all higher frequencies will be aggregated into it. A list gives the max_freq of each of the `dim_cols`.
             dim_cols (list of str): The label for frequency dimension columns.
             reach_col (str): The label for the n_reach column.
             population_size (int): The size of the total population. If it is None, the dataframe should have the all zeros row so that the total count of reach column can be interpreted as the `population_size`.
@@ -68,10 +69,11 @@ class RFReport(AbstractRFReport) :
         self.impressions = impressions
 
         rfdata = dataframe.copy()
+        max_freqs = _max_freqs(max_freq, len(dim_cols))
 
         # Aggregate all frequencies larger than the max_freq into the max_freq
-        for col in dim_cols :
-            rfdata[col]  = np.where(rfdata[col] >= max_freq, max_freq, rfdata[col])
+        for col, col_max_freq in zip(dim_cols, max_freqs) :
+            rfdata[col]  = np.where(rfdata[col] >= col_max_freq, col_max_freq, rfdata[col])
 
         rfdata = rfdata.groupby(dim_cols)[reach_col].sum().reset_index()
 
@@ -79,7 +81,7 @@ class RFReport(AbstractRFReport) :
         rfdata = (
             pd.merge(
                 rfdata,
-                pd.DataFrame(np.array(list(itertools.product(*[range(0, max_freq+1) for c in dim_cols]))),
+                pd.DataFrame(np.array(list(itertools.product(*[range(0, col_max_freq+1) for col_max_freq in max_freqs]))),
                              columns=dim_cols),
                 on = dim_cols,
                 how='right'
@@ -100,7 +102,8 @@ class RFReport(AbstractRFReport) :
             self.population_size = population_size_intable
 
         self.rfdata          = rfdata.fillna(0)
-        self.max_freq        = max_freq
+        self.max_freq        = max_freq if np.ndim(max_freq) == 0 else [int(col_max_freq) for col_max_freq in max_freqs]
+        self.max_freqs       = max_freqs
         self.dim_cols        = dim_cols
         self.reach_col       = reach_col
         self.n_dims          = len(dim_cols)
@@ -123,32 +126,33 @@ class RFReport(AbstractRFReport) :
     def gr_values(self, grs) :
         self._impressions = (grs * self.population_size).astype('int')
 
-    def _copy_and_trim_to_max_freq(self, ) :
-        return
+    def _copy_and_trim_to_max_freq(self, max_freq) :
+        """A copy of the report data aggregated to a smaller max_freq (an integer or a per dimension list), or the report data itself for the same max_freq."""
+        max_freqs = _max_freqs(max_freq, self.n_dims)
+        if np.any(max_freqs > self.max_freqs) :
+            raise Exception(f"max_freq should be less than or equal to {self.max_freq}")
+
+        if np.array_equal(max_freqs, self.max_freqs) :
+            return self.rfdata
+
+        rfdata = self.rfdata.copy()
+        for col, col_max_freq in zip(self.dim_cols, max_freqs) :
+            rfdata[col]  = np.where(rfdata[col] >= col_max_freq, col_max_freq, rfdata[col])
+
+        return rfdata.groupby(self.dim_cols)[self.reach_col].sum().reset_index()
 
     def reach_freq_values(self, normalized=False, max_freq=None) :
         """Returns the the reach and frequencies values in the report.
 
         Args:
             normalized (Bool): If True devides the reach values by the population_size (default False)
-            max_freq (int) : If given trims the frequencies to the max_freq. It must be less than or equal to the current max_freq of the report.
+            max_freq (int or list of ints) : If given trims the frequencies to the max_freq (of each dimension). It must be less than or equal to the current max_freq of the report.
 
         Returns:
             The values as a tuple of `(reach, frequencies)`.
         """
-        result = None
-        if max_freq is None or max_freq == self.max_freq :
-            max_freq = self.max_freq
-            result = self.rfdata[self.reach_col].values, self.rfdata[self.dim_cols].values
-        elif max_freq < self.max_freq :
-            rfdata = self.rfdata.copy()
-            for col in self.dim_cols :
-                rfdata[col]  = np.where(rfdata[col] >= max_freq, max_freq, rfdata[col])
-
-            rfdata = rfdata.groupby(dim_cols).sum().reset_index()
-            result = rfdata[self.reach_col].values, rfdata[self.dim_cols].values
-        else :
-            raise Exception(f"max_freq should be less than or equal to {self.max_freq}")
+        rfdata = self.rfdata if max_freq is None else self._copy_and_trim_to_max_freq(max_freq)
+        result = rfdata[self.reach_col].values, rfdata[self.dim_cols].values
 
         if normalized :
             return result[0]/self.population_size, result[1]
@@ -160,7 +164,7 @@ class RFReport(AbstractRFReport) :
 
         Args:
             normalized (Bool): If True, devides the dataframe, or the reach values by the population_size (default False)
-            max_freq (int) : If given trims the frequencies to the max_freq. It must be less than or equal to the current max_freq of the report.
+            max_freq (int or list of ints) : If given trims the frequencies to the max_freq (of each dimension). It must be less than or equal to the current max_freq of the report.
 
         Returns:
             The pivoted dataframe (currently only working for two dimensions)
@@ -170,33 +174,24 @@ class RFReport(AbstractRFReport) :
         if self.n_dims > 2 :
             raise Exception("Currently only two dimensions are supported for pivoting!")
 
-        result = None
-        if max_freq is None or max_freq == self.max_freq :
-            max_freq = self.max_freq
-            result = self.rfdata.pivot(
-                index=self.dim_cols[0],
-                columns=self.dim_cols[1],
-                values=self.reach_col
-            )
-        elif max_freq < self.max_freq :
-            rfdata = self.rfdata.copy()
-            for col in self.dim_cols :
-                rfdata[col]  = np.where(rfdata[col] >= max_freq, max_freq, rfdata[col])
-
-            rfdata = rfdata.groupby(self.dim_cols).sum().reset_index()
-            result = rfdata.pivot(
-                index=self.dim_cols[0],
-                columns=self.dim_cols[1],
-                values=self.reach_col
-            )
-        else :
-            raise Exception(f"max_freq should be less than {self.max_freq}")
+        rfdata = self.rfdata if max_freq is None else self._copy_and_trim_to_max_freq(max_freq)
+        result = rfdata.pivot(
+            index=self.dim_cols[0],
+            columns=self.dim_cols[1],
+            values=self.reach_col
+        )
 
         if normalized :
             return result/self.population_size
         else :
             return result
 
+    def _max_freq_of(self, dim_cols) :
+        """The max_freq of a report of a subset of the `dim_cols`, an integer if this report has a single max_freq."""
+        if np.ndim(self.max_freq) == 0 :
+            return self.max_freq
+        return [int(self.max_freqs[self.dim_cols.index(col)]) for col in dim_cols]
+
 
     def drop(self, dims) :
         """Drops or removes dimension(s) of the report and effectively generates a new report with one or more less dimension.
@@ -219,7 +214,7 @@ class RFReport(AbstractRFReport) :
 
         rfdata = self.rfdata.drop(dims, axis=1).groupby(dim_cols).sum().reset_index()
 
-        return RFReport(rfdata, self.max_freq, dim_cols, self.reach_col, self.population_size)
+        return RFReport(rfdata, self._max_freq_of(dim_cols), dim_cols, self.reach_col, self.population_size)
 
     def combine_dims(self, dims, name) :
         """Combine multiple dimensions into a single dimensions by summing all the frequencies. This method collapses multiple dimensions of the report into one. Note that the combined column will be the last column.
@@ -229,7 +224,7 @@ class RFReport(AbstractRFReport) :
             name (string): The name of the new combined dimension.
 
         Returns:
-            RFReport with the given dimensions collapsed.
+            RFReport with the given dimensions collapsed. With per dimension max_freqs the combined dimension gets the smallest max_freq of the combined ones, as the frequencies of each dimension are capped at their own max_freq and their sum is only exact below the smallest of them.
         """
         
         cols = dims if isinstance(dims, (list, tuple)) else [dims]
@@ -237,15 +232,19 @@ class RFReport(AbstractRFReport) :
             raise Exception(f"One or more of columns {cols} do not exist in {self.dim_cols}.")
 
         dim_cols = [c for c in self.dim_cols if c not in cols]
+        max_freq = self._max_freq_of(dim_cols)
+        combined_max_freq = int(np.min(self._max_freq_of(cols)))
+        if np.ndim(max_freq) > 0 :
+            max_freq.append(combined_max_freq)
         dim_cols.append(name)
 
         rfdata = self.rfdata.copy()
         rfdata[name] = rfdata[cols].sum(axis=1)
-        rfdata[name] = np.where(rfdata[name] >= self.max_freq, self.max_freq, rfdata[name])
+        rfdata[name] = np.where(rfdata[name] >= combined_max_freq, combined_max_freq, rfdata[name])
         rfdata.drop(cols, axis=1)
         rfdata = rfdata.groupby(dim_cols)[self.reach_col].sum().reset_index()
 
-        return RFReport(rfdata, self.max_freq, dim_cols, self.reach_col, self.population_size)
+        return RFReport(rfdata, max_freq, dim_cols, self.reach_col, self.population_size)
 
     def plot_1d_reach(self, dim, ax=None) :
         if dim not in self.dim_cols:
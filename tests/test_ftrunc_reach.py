@@ -0,0 +1,81 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import itertools
+import warnings
+
+import numpy as np
+import pytest
+
+from audience_modeling_toolbox.model import NormalExponentialADF, NormalDeltaADF, MixtureOfExponentials, MixtureOfDeltas
+
+def _loop_ftrunc_reach(adf, grs, max_freq) :
+    """The truncated reach box of a simple ADF by the original loop over the frequencies and the gross ratings."""
+    freqs = np.array(list(
+        itertools.product(*[range(max_freq+1) for i in range(adf.n_dims)])
+        ))
+    R = adf._f_reach(np.reshape(grs, [-1, 1, adf.n_dims]),
+                     np.reshape(freqs, [1, -1, adf.n_dims]))
+
+    R_truncate = adf._fplus_reach(np.reshape(grs, [-1, 1, adf.n_dims]),
+                                  max_freq * np.ones([1, 1, adf.n_dims]))
+    for n_freq, n_dim in itertools.product(range((max_freq+1)**adf.n_dims), range(adf.n_dims)) :
+        if freqs[n_freq, n_dim] == max_freq :
+            for n_gr in range(R.shape[0]) :
+                R[n_gr, n_freq, n_dim] = R_truncate[n_gr, 0, n_dim]
+
+    return np.prod(R, axis=2)
+
+def _loop_mixture_ftrunc_reach(adf, grs, max_freq) :
+    """The truncated reach box of a mixture as the amplitude weighted sum of the loop boxes of its simple ADFs."""
+    return np.tensordot(
+        adf.amplitudes,
+        np.array([_loop_ftrunc_reach(simple_adf, grs, max_freq) for simple_adf in adf.simple_adfs]),
+        axes=([0], [0])
+    )
+
+def _adfs(n_dims, rng) :
+    with warnings.catch_warnings() :
+        warnings.simplefilter("ignore")
+        return {
+            "exponential" : NormalExponentialADF(rng.random(n_dims) * 3 + 0.1),
+            "delta"       : NormalDeltaADF(rng.random(n_dims) * 3 + 0.1),
+            "mixture_of_exponentials" : MixtureOfExponentials.random(4, n_dims, rng),
+            "mixture_of_deltas"       : MixtureOfDeltas.random(3, n_dims, rng),
+        }
+
+@pytest.mark.parametrize("n_dims", [1, 2, 3])
+@pytest.mark.parametrize("kind", ["exponential", "delta", "mixture_of_exponentials", "mixture_of_deltas"])
+@pytest.mark.parametrize("max_freq", [0, 1, 4, 7])
+@pytest.mark.parametrize("method", ["recurrence", "direct", "log"])
+def test_ftrunc_reach_matches_loop(n_dims, kind, max_freq, method) :
+    rng = np.random.default_rng(n_dims)
+    adf = _adfs(n_dims, rng)[kind]
+    grs = np.vstack([np.zeros(n_dims), rng.random((5, n_dims)) * 4])
+
+    expected = _loop_mixture_ftrunc_reach(adf, grs, max_freq) if kind.startswith("mixture") else _loop_ftrunc_reach(adf, grs, max_freq)
+    reaches  = adf.ftrunc_reach(grs, max_freq, method=method)
+
+    assert reaches.shape == (len(grs), (max_freq+1)**n_dims)
+    assert np.all(np.isfinite(reaches))
+    np.testing.assert_allclose(reaches, expected, rtol=1.0e-9, atol=1.0e-12)
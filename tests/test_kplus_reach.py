@@ -0,0 +1,55 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import numpy as np
+import pytest
+
+from audience_modeling_toolbox.model import NormalExponentialADF, MixtureOfDeltas
+
+@pytest.mark.parametrize("adf", [NormalExponentialADF(np.array([1.0, 2.0])), MixtureOfDeltas.random(2, 2, np.random.default_rng(0))])
+@pytest.mark.parametrize("k", [0, -1, 1.5, 2.0])
+def test_kplus_reach_rejects_k_below_one(adf, k) :
+    grs = np.array([[1.0, 2.0]])
+    with pytest.raises(ValueError, match="at least 1") :
+        adf.kplus_reach(grs, k)
+    with pytest.raises(ValueError, match="at least 1") :
+        adf.kplus_reach_gradient(grs, k)
+
+def test_kplus_reach_of_k_one_is_the_total_reach() :
+    adf = MixtureOfDeltas.random(2, 2, np.random.default_rng(0))
+    grs = np.array([[1.0, 2.0], [0.0, 0.5]])
+    np.testing.assert_allclose(adf.kplus_reach(grs, 1), 1 - adf.ftrunc_reach(grs, 1)[:, 0])
+
+@pytest.mark.parametrize("reaches, k", [([0.3, 1.0], 1), ([-0.1], 1), ([np.nan], 1), ([0.3], 0), ([0.3, 0.4], [1, 0])])
+def test_inverse_kplus_reach_rejects_bad_targets(reaches, k) :
+    adf = MixtureOfDeltas.random(2, 2, np.random.default_rng(0))
+    with pytest.raises(ValueError) :
+        adf.inverse_kplus_reach(reaches, k)
+
+def test_inverse_kplus_reach_hits_the_targets() :
+    adf = MixtureOfDeltas.random(2, 2, np.random.default_rng(0))
+    reaches, ks = np.array([0.0, 0.3, 0.6]), np.array([1, 2, 1])
+    grs = adf.inverse_kplus_reach(reaches, ks)
+    for reach, k, plan in zip(reaches, ks, grs) :
+        np.testing.assert_allclose(adf.kplus_reach(plan, k), reach, atol=1.0e-8)
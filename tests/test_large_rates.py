@@ -0,0 +1,66 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import numpy as np
+import pytest
+
+from audience_modeling_toolbox.model import NormalDeltaADF, MixtureOfDeltas, set_default_dtype
+
+@pytest.mark.parametrize("rate, max_freq", [(700.0, 800), (745.0, 900), (800.0, 1000), (2000.0, 2200), (800.0, 20)])
+@pytest.mark.parametrize("method", ["recurrence", "direct"])
+def test_delta_box_at_large_rates(rate, max_freq, method) :
+    # exp(-rate) underflows beyond a rate of about 708, the log evaluation is the reference
+    adf = NormalDeltaADF(np.array([1.0]))
+    grs = np.array([[rate]])
+
+    reaches  = adf.ftrunc_reach(grs, max_freq, method=method)
+    expected = adf.ftrunc_reach(grs, max_freq, method="log")
+
+    assert np.all(np.isfinite(reaches)) and np.all(reaches >= 0)
+    np.testing.assert_allclose(reaches.sum(axis=1), 1.0, rtol=1.0e-12)
+    np.testing.assert_allclose(reaches, expected, rtol=1.0e-9, atol=1.0e-11)
+
+def test_mixture_of_deltas_box_at_large_rates() :
+    adf = MixtureOfDeltas.random(3, 2, np.random.default_rng(0))
+    grs = np.array([[0.0, 1.0], [2.0, 3.0], [900.0, 2.0], [1500.0, 1200.0]]) / adf.parameters.min()
+    max_freq = [1100, 3]
+
+    reaches = adf.ftrunc_reach(grs, max_freq)
+    np.testing.assert_allclose(reaches.sum(axis=1), 1.0, rtol=1.0e-12)
+    np.testing.assert_allclose(reaches, adf.ftrunc_reach(grs, max_freq, method="log"), rtol=1.0e-9, atol=1.0e-11)
+
+def test_delta_box_at_large_rates_in_single_precision() :
+    # in single precision exp(-rate) already underflows beyond a rate of about 87
+    adf = NormalDeltaADF(np.array([1.0]))
+    grs = np.array([[100.0], [150.0]])
+    expected = adf.ftrunc_reach(grs, 200)
+
+    set_default_dtype(np.float32)
+    try :
+        reaches = adf.ftrunc_reach(grs, 200)
+    finally :
+        set_default_dtype(np.float64)
+
+    assert reaches.dtype == np.float32
+    np.testing.assert_allclose(reaches.sum(axis=1), 1.0, rtol=1.0e-5)
+    np.testing.assert_allclose(reaches, expected, atol=1.0e-6)
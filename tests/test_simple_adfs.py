@@ -0,0 +1,46 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import numpy as np
+import pytest
+
+from audience_modeling_toolbox.model import MixtureOfExponentials
+
+def test_component_parameters_are_read_only() :
+    adf = MixtureOfExponentials.random(2, 2, np.random.default_rng(0))
+    component = adf.simple_adfs[0]
+    parameters = adf.parameters.copy()
+
+    with pytest.raises(ValueError) :
+        component.parameters[0] = 5.0
+    np.testing.assert_array_equal(adf.parameters, parameters)
+
+def test_component_parameters_write_through_the_setter() :
+    adf = MixtureOfExponentials.random(2, 2, np.random.default_rng(0))
+    grs = np.array([[1.0, 2.0]])
+    before = adf.ftrunc_reach(grs, 2)
+
+    adf.simple_adfs[0].parameters = np.array([5.0, 1.0])
+    np.testing.assert_array_equal(adf.parameters[:2], [5.0, 1.0])
+    assert not np.allclose(adf.ftrunc_reach(grs, 2), before)
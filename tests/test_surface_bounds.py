@@ -0,0 +1,52 @@
+# MIT License
+
+# Copyright (c) 2021 OpenMeasurement
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import numpy as np
+import pytest
+
+from audience_modeling_toolbox.model import NormalExponentialADF, NormalDeltaADF, MixtureADF, ReachSurfaceIndex
+
+def _adf(kind, n_dims, rng) :
+    if kind == "exponential" :
+        return NormalExponentialADF(rng.random(n_dims) * 3 + 0.2)
+    elif kind == "delta" :
+        return NormalDeltaADF(rng.random(n_dims) * 3 + 0.2)
+    else :
+        simple_adfs = [NormalExponentialADF(rng.random(n_dims) * 3 + 0.2) for i in range(2)] + [NormalDeltaADF(rng.random(n_dims) * 10 + 0.2) for i in range(2)]
+        return MixtureADF(np.array([0.4, 0.3, 0.2, 0.1]), simple_adfs)
+
+@pytest.mark.parametrize("kind", ["exponential", "delta", "mixture"])
+@pytest.mark.parametrize("n_dims, max_freq", [(1, 0), (1, 5), (2, 1), (2, [8, 3])])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_interpolation_error_within_bounds(kind, n_dims, max_freq, dtype) :
+    rng = np.random.default_rng(0)
+    adf = _adf(kind, n_dims, rng)
+    index = ReachSurfaceIndex(adf, [np.linspace(0.0, 8.0, 30)] * n_dims, max_freq, dtype=dtype)
+
+    grs = rng.random([2000, n_dims]) * 8.0
+    errors = np.abs(index.interpolate(grs) - adf.ftrunc_reach(grs, max_freq)).max(axis=1)
+    assert np.all(errors <= index.error_bound(grs))
+
+    tol = np.median(index.error_bound(grs))
+    assert np.all(np.abs(index.ftrunc_reach(grs, tol=tol) - adf.ftrunc_reach(grs, max_freq)).max(axis=1) <= tol)